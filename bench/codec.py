@@ -0,0 +1,87 @@
+"""
+Micro-benchmark of entity encoding and decoding, the compiled codec against dataclass_json.
+
+dataclass_json is applied to subclasses of the entities, so both paths build the same documents:
+
+    pipenv run python -m bench.codec --rows 20000
+"""
+import argparse
+import os
+import time
+
+COLUMNS = ['entity', 'operation', 'dataclass_json_us', 'codec_us', 'speedup']
+
+
+def setup_environment() -> None:
+    os.environ.setdefault('DISCORD_API_TOKEN', 'bench')
+    os.environ.setdefault('MONGODB_HOST', 'localhost')
+    os.environ.setdefault('MONGODB_PORT', '27017')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+
+def legacy(cls: type) -> type:
+    from dataclasses_json import dataclass_json
+
+    return dataclass_json(type(f'Legacy{cls.__name__}', (cls,), {'__slots__': ()}))
+
+
+def sample_entities() -> list:
+    from bot import db
+
+    payload = db.ForwardPayload(
+        message_id=1, channel_id=2, content='hello ' * 20, jump_url='https://discord.com/channels/1/2/3',
+        author_id=4, author_name='user', author_display_name='User', author_avatar_url='https://cdn/a.png',
+        colour=db.Colour(5), guild_name='guild', guild_icon_url='https://cdn/g.png',
+        attachments=[db.AttachmentRef(id=6, filename='a.png', url='https://cdn/f.png', size=1000)]
+    )
+    return [
+        db.User(name='user', display_name='User', id=1, colour=db.Colour(5)),
+        db.Bridge(name='bridge', creator_id=1, channel_ids=list(range(15))),
+        db.ForwardedMessage(original_id=1, original_channel_id=2, channel_id=3, bridge_name='bridge', id=4),
+        db.Delivery(bridge_name='bridge', channel_id=3, payload=payload, id='1:3'),
+    ]
+
+
+def measure(func, arg, rows: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rows):
+        func(arg)
+    return (time.perf_counter() - started) / rows * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20_000)
+    args = parser.parse_args()
+
+    setup_environment()
+    from bot.db.codec import codec_for
+
+    rows = []
+    for entity in sample_entities():
+        cls = type(entity)
+        legacy_cls = legacy(cls)
+        codec = codec_for(cls)
+        doc = codec.encode(entity)
+        legacy_entity = legacy_cls.from_dict(doc)
+        assert legacy_entity.to_dict() == doc and codec.decode(doc) == entity
+
+        rows.append([cls.__name__, 'decode', measure(legacy_cls.from_dict, doc, args.rows),
+                     measure(codec.decode, doc, args.rows)])
+        rows.append([cls.__name__, 'encode', measure(legacy_cls.to_dict, legacy_entity, args.rows),
+                     measure(codec.encode, entity, args.rows)])
+
+    # the routing index load only needs two fields of every bridge
+    bridge_codec = codec_for(type(sample_entities()[1]))
+    bridge_doc = bridge_codec.encode(sample_entities()[1])
+    rows.append(['Bridge', 'decode 2 fields', measure(legacy(bridge_codec.cls).from_dict, bridge_doc, args.rows),
+                 measure(lambda doc: bridge_codec.decode_fields(doc, ['name', 'channel_ids']), bridge_doc, args.rows)])
+
+    print(' '.join(f'{column:>18}' for column in COLUMNS))
+    for name, operation, before, after in rows:
+        row = [name, operation, f'{before:.2f}', f'{after:.2f}', f'{before / after:.1f}x']
+        print(' '.join(f'{value:>18}' for value in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import discord
+
+# discord snowflakes of the fake objects, far above the ids used in setup
+_snowflakes = itertools.count(10 ** 17)
+
+
+def next_snowflake() -> int:
+    return next(_snowflakes)
+
+
+@dataclass
+class FakeAsset:
+    url: str
+
+
+@dataclass
+class FakeUser:
+    id: int
+    name: str
+    display_name: str
+    colour: discord.Colour
+    display_avatar: FakeAsset
+    global_name: str | None = None
+    bot: bool = False
+
+
+@dataclass
+class FakeGuild:
+    id: int
+    name: str
+    icon: FakeAsset | None
+
+
+@dataclass
+class FakeSentMessage:
+    id: int
+    channel: 'FakeChannel'
+    kwargs: dict[str, Any]
+    webhook_id: int | None = None
+
+
+@dataclass
+class FakeReference:
+    message_id: int
+
+
+# Stands in for discord.TextChannel, send() simulates the HTTP round-trip
+@dataclass
+class FakeChannel:
+    id: int
+    name: str
+    guild: FakeGuild
+    layer: 'FakeDiscord'
+
+    async def history(self, **kwargs):
+        # nothing was missed while the bot was away
+        for message in ():
+            yield message
+
+    async def send(self, *args, **kwargs) -> FakeSentMessage:
+        await asyncio.sleep(self.layer.send_latency)
+        sent = FakeSentMessage(next_snowflake(), self, kwargs)
+        self.layer.record_send(sent)
+        return sent
+
+
+@dataclass
+class FakeMessage:
+    id: int
+    content: str
+    author: FakeUser
+    channel: FakeChannel
+    guild: FakeGuild
+    reference: FakeReference | None = None
+    webhook_id: int | None = None
+    attachments: list = field(default_factory=list)
+    embeds: list = field(default_factory=list)
+
+    @property
+    def jump_url(self) -> str:
+        return f'https://discord.com/channels/{self.guild.id}/{self.channel.id}/{self.id}'
+
+
+# Fake Discord HTTP/channel layer: channels by id, every send recorded with its forward latency
+class FakeDiscord:
+    def __init__(self, send_latency: float):
+        self.send_latency = send_latency
+        self.channels: dict[int, FakeChannel] = {}
+        self.sent: list[FakeSentMessage] = []
+        self.latencies: list[float] = []
+        self._dispatched_at: dict[str, float] = {}
+
+    def add_channel(self, channel_id: int, guild: FakeGuild) -> FakeChannel:
+        channel = FakeChannel(channel_id, f'channel-{channel_id}', guild, self)
+        self.channels[channel_id] = channel
+        return channel
+
+    def get_channel(self, channel_id: int) -> FakeChannel | None:
+        return self.channels.get(channel_id)
+
+    def dispatched(self, message: FakeMessage) -> None:
+        self._dispatched_at[message.jump_url] = time.perf_counter()
+
+    def record_send(self, sent: FakeSentMessage) -> None:
+        self.sent.append(sent)
+        embed = sent.kwargs.get('embed')
+        dispatched_at = self._dispatched_at.get(embed.author.url) if embed is not None else None
+        if dispatched_at is not None:
+            self.latencies.append(time.perf_counter() - dispatched_at)
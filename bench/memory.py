@@ -0,0 +1,165 @@
+"""
+Offline benchmark of the bot's resident memory under the runtime profiles.
+
+A discord.py client built with the options of each profile is fed synthetic gateway events: GUILD_CREATE for every
+guild, then a stream of MESSAGE_CREATE. Voice states are only sent when the profile has the voice states intent,
+like Discord does. Every profile runs in a fresh process, the RSS growth over the empty client is reported:
+
+    pipenv run python -m bench.memory --profiles default,lean --guilds 200 --messages 20000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+
+COLUMNS = ['profile', 'guilds', 'messages', 'rss_mb', 'cached_messages', 'cached_members']
+
+
+def setup_environment() -> None:
+    os.environ.setdefault('DISCORD_API_TOKEN', 'bench')
+    os.environ.setdefault('MONGODB_HOST', 'localhost')
+    os.environ.setdefault('MONGODB_PORT', '27017')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+
+def rss_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def user_data(user_id: int) -> dict:
+    return {'id': str(user_id), 'username': f'user-{user_id}', 'discriminator': '0', 'global_name': f'User {user_id}',
+            'avatar': 'a' * 32}
+
+
+def member_data(user_id: int, role_ids: list[str]) -> dict:
+    return {'user': user_data(user_id), 'nick': None, 'roles': role_ids, 'joined_at': '2023-01-01T00:00:00+00:00',
+            'deaf': False, 'mute': False, 'flags': 0}
+
+
+def guild_data(guild_id: int, args: argparse.Namespace, voice_states: bool) -> dict:
+    role_ids = [str(guild_id * 1000 + i) for i in range(args.roles)]
+    channel_ids = [str(guild_id * 1000 + 500 + i) for i in range(args.channels)]
+    voice_user_ids = [guild_id * 100_000 + i for i in range(args.voice_members)]
+    return {
+        'id': str(guild_id), 'name': f'guild-{guild_id}', 'icon': 'b' * 32, 'owner_id': '1', 'afk_timeout': 300,
+        'verification_level': 0, 'default_message_notifications': 0, 'explicit_content_filter': 0, 'mfa_level': 0,
+        'features': [], 'premium_tier': 0, 'system_channel_flags': 0, 'nsfw_level': 0, 'preferred_locale': 'en-US',
+        'member_count': 5000, 'large': True, 'unavailable': False, 'joined_at': '2023-01-01T00:00:00+00:00',
+        'roles': [
+            {'id': role_id, 'name': f'role-{i}', 'color': i * 1000, 'hoist': False, 'position': i,
+             'permissions': '0', 'managed': False, 'mentionable': False}
+            for i, role_id in enumerate(role_ids)
+        ],
+        'channels': [
+            {'id': channel_id, 'type': 0, 'name': f'channel-{i}', 'position': i, 'guild_id': str(guild_id),
+             'permission_overwrites': [], 'nsfw': False, 'topic': 'topic ' * 10, 'last_message_id': None}
+            for i, channel_id in enumerate(channel_ids)
+        ],
+        'emojis': [
+            {'id': str(guild_id * 1000 + 800 + i), 'name': f'emoji{i}', 'roles': [], 'require_colons': True,
+             'managed': False, 'animated': False, 'available': True}
+            for i in range(args.emojis)
+        ],
+        'stickers': [], 'threads': [], 'stage_instances': [], 'guild_scheduled_events': [], 'presences': [],
+        'members': [member_data(user_id, role_ids[:2]) for user_id in voice_user_ids] if voice_states else [],
+        'voice_states': [
+            {'user_id': str(user_id), 'channel_id': channel_ids[0], 'session_id': 's', 'deaf': False, 'mute': False,
+             'self_deaf': False, 'self_mute': False, 'self_video': False, 'suppress': False}
+            for user_id in voice_user_ids
+        ] if voice_states else [],
+    }
+
+
+def message_data(message_id: int, guild: dict, rnd: random.Random, args: argparse.Namespace) -> dict:
+    author_id = rnd.randrange(args.users)
+    return {
+        'id': str(message_id), 'channel_id': rnd.choice(guild['channels'])['id'], 'guild_id': guild['id'], 'type': 0,
+        'content': 'message ' * 25, 'author': user_data(author_id),
+        'member': {k: v for k, v in member_data(author_id, [guild['roles'][0]['id']]).items() if k != 'user'},
+        'timestamp': '2024-01-01T00:00:00+00:00', 'edited_timestamp': None, 'tts': False, 'mention_everyone': False,
+        'mentions': [], 'mention_roles': [], 'attachments': [], 'embeds': [], 'pinned': False, 'flags': 0,
+    }
+
+
+async def run_profile(args: argparse.Namespace) -> dict:
+    import discord
+    from bot.gateway import gateway_options
+    from env import RuntimeProfile
+
+    options = gateway_options(RuntimeProfile(args.profiles))
+    client = discord.Client(**options)
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=user_data(1))
+    gc.collect()
+    baseline = rss_bytes()
+
+    rnd = random.Random(args.seed)
+    guilds = [guild_data(10 ** 6 + i, args, options['intents'].voice_states) for i in range(args.guilds)]
+    for guild in guilds:
+        state.parse_guild_create(guild)
+    for i in range(args.messages):
+        state.parse_message_create(message_data(10 ** 15 + i, rnd.choice(guilds), rnd, args))
+        if i % 1000 == 0:
+            # dispatched events run as tasks, let them finish
+            await asyncio.sleep(0)
+    del guilds
+    gc.collect()
+
+    return {
+        'profile': args.profiles,
+        'guilds': args.guilds,
+        'messages': args.messages,
+        'rss_mb': round((rss_bytes() - baseline) / 1024 / 1024, 1),
+        'cached_messages': len(state._messages or []),
+        'cached_members': sum(len(guild._members) for guild in state.guilds),
+    }
+
+
+def print_table(rows: list[dict]) -> None:
+    print(' '.join(f'{column:>16}' for column in COLUMNS))
+    for row in rows:
+        print(' '.join(f'{row[column]:>16}' for column in COLUMNS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', default='default,lean', help='runtime profiles, comma-separated values')
+    parser.add_argument('--guilds', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=50, help='text channels per guild')
+    parser.add_argument('--roles', type=int, default=30, help='roles per guild')
+    parser.add_argument('--emojis', type=int, default=50, help='emojis per guild')
+    parser.add_argument('--voice-members', type=int, default=10, help='members in voice per guild')
+    parser.add_argument('--messages', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=5_000, help='distinct message authors')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='print results as json lines')
+    args = parser.parse_args()
+
+    profiles = args.profiles.split(',')
+    if len(profiles) == 1:
+        setup_environment()
+        rows = [asyncio.run(run_profile(args))]
+    else:
+        rows = []
+        # fresh process per profile, RSS never shrinks back after a run
+        for profile in profiles:
+            command = [sys.executable, '-m', 'bench.memory', '--json', '--profiles', profile]
+            for name in ('guilds', 'channels', 'roles', 'emojis', 'voice_members', 'messages', 'users', 'seed'):
+                command += [f'--{name.replace("_", "-")}', str(getattr(args, name))]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            rows += [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Offline end-to-end benchmark of bot.main.on_message.
+
+Discord is replaced by a fake channel layer and Mongo by mongomock (or a local mongod with --real-mongo),
+so the numbers measure the bot's own forwarding pipeline. Every combination of the comma-separated
+--bridges/--channels/--reply-ratio values runs in a fresh process:
+
+    pipenv run python -m bench.on_message --bridges 1,4 --channels 3,15 --reply-ratio 0,0.2
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from unittest import mock
+
+COLUMNS = ['bridges', 'channels', 'reply_ratio', 'messages', 'copies', 'msgs_per_sec',
+           'p50_ms', 'p99_ms', 'db_calls_per_msg']
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def setup_environment(real_mongo: bool) -> None:
+    os.environ.setdefault('DISCORD_API_TOKEN', 'bench')
+    os.environ.setdefault('MONGODB_HOST', 'localhost')
+    os.environ.setdefault('MONGODB_PORT', '27017')
+    os.environ['SERVICE_NAME'] = 'bridge-bot-bench'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if not real_mongo:
+        import mongomock
+        mock.patch('pymongo.MongoClient', mongomock.MongoClient).start()
+
+
+async def run_scenario(args: argparse.Namespace) -> dict:
+    from bench.fakes import FakeDiscord, FakeGuild, FakeAsset, FakeUser, FakeMessage, FakeReference, next_snowflake
+    from bot import db, main
+
+    db.settings.metrics_port = None
+    db.mongo_client.drop_database(db.settings.service_name)
+    layer = FakeDiscord(args.send_latency)
+    main.bot.get_channel = layer.get_channel
+
+    async def process_commands(message):
+        pass
+    main.bot.process_commands = process_commands
+
+    db_calls = 0
+    run = db.AsyncDbManager.run
+
+    async def counting_run(self, func, *func_args, **func_kwargs):
+        nonlocal db_calls
+        db_calls += 1
+        return await run(self, func, *func_args, **func_kwargs)
+
+    guild = FakeGuild(1, 'bench', FakeAsset('https://cdn.example/guild.png'))
+    channel_ids = []
+    for b in range(args.bridges):
+        bridge_channel_ids = [next_snowflake() for _ in range(args.channels)]
+        for channel_id in bridge_channel_ids:
+            layer.add_channel(channel_id, guild)
+        await db.bridges.create(db.Bridge(name=f'bridge-{b}', creator_id=1, channel_ids=bridge_channel_ids))
+        channel_ids += bridge_channel_ids
+    await main.bot.setup_hook()
+    await main.on_ready()
+
+    users = [
+        FakeUser(i, f'user-{i}', f'User {i}', main.discord.Colour(i), FakeAsset(f'https://cdn.example/{i}.png'))
+        for i in range(args.users)
+    ]
+    rnd = random.Random(args.seed)
+
+    async def dispatch(count: int, reply_ratio: float) -> None:
+        tasks = []
+        for i in range(count):
+            reference = None
+            if layer.sent and rnd.random() < reply_ratio:
+                replied = rnd.choice(layer.sent)
+                channel, reference = replied.channel, FakeReference(replied.id)
+            else:
+                channel = layer.channels[rnd.choice(channel_ids)]
+            message = FakeMessage(next_snowflake(), f'message {i}', rnd.choice(users), channel, guild, reference)
+            layer.dispatched(message)
+            # discord.py dispatches every event as its own task
+            tasks.append(asyncio.create_task(main.on_message(message)))
+            if args.rate:
+                await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*tasks)
+
+    # warm-up: fills the user cache and gives replies something to reply to
+    await dispatch(args.users, 0)
+    layer.latencies.clear()
+    copies_before = len(layer.sent)
+
+    with mock.patch.object(db.AsyncDbManager, 'run', counting_run):
+        started = time.perf_counter()
+        await dispatch(args.messages, args.reply_ratio)
+        elapsed = time.perf_counter() - started
+        for buffer in db.write_buffers:
+            await buffer.flush()
+    await main.bot.close()
+
+    return {
+        'bridges': args.bridges,
+        'channels': args.channels,
+        'reply_ratio': args.reply_ratio,
+        'messages': args.messages,
+        'copies': len(layer.sent) - copies_before,
+        'msgs_per_sec': round(args.messages / elapsed, 1),
+        'p50_ms': round(percentile(layer.latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(layer.latencies, 0.99) * 1000, 2),
+        'db_calls_per_msg': round(db_calls / args.messages, 2),
+    }
+
+
+def parse_list(value: str, cast: type) -> list:
+    return [cast(v) for v in value.split(',')]
+
+
+def print_table(rows: list[dict]) -> None:
+    print(' '.join(f'{column:>16}' for column in COLUMNS))
+    for row in rows:
+        print(' '.join(f'{row[column]:>16}' for column in COLUMNS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bridges', default='1,4', help='bridges, comma-separated values to sweep')
+    parser.add_argument('--channels', default='3,15', help='channels per bridge, comma-separated values to sweep')
+    parser.add_argument('--reply-ratio', default='0,0.2', help='share of replies, comma-separated values to sweep')
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=0, help='messages per second, 0 dispatches all at once')
+    parser.add_argument('--send-latency', type=float, default=0.005, help='simulated Discord send latency, seconds')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--real-mongo', action='store_true', help='use MONGODB_HOST/MONGODB_PORT instead of mongomock')
+    parser.add_argument('--json', action='store_true', help='print results as json lines')
+    args = parser.parse_args()
+
+    scenarios = list(itertools.product(
+        parse_list(args.bridges, int), parse_list(args.channels, int), parse_list(args.reply_ratio, float)
+    ))
+    if len(scenarios) == 1:
+        args.bridges, args.channels, args.reply_ratio = scenarios[0]
+        setup_environment(args.real_mongo)
+        rows = [asyncio.run(run_scenario(args))]
+    else:
+        rows = []
+        # fresh process per scenario, so caches and queues don't leak between them
+        for bridges, channels, reply_ratio in scenarios:
+            command = [sys.executable, '-m', 'bench.on_message', '--json',
+                       '--bridges', str(bridges), '--channels', str(channels), '--reply-ratio', str(reply_ratio),
+                       '--messages', str(args.messages), '--users', str(args.users), '--rate', str(args.rate),
+                       '--send-latency', str(args.send_latency), '--seed', str(args.seed)]
+            if args.real_mongo:
+                command.append('--real-mongo')
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            rows += [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
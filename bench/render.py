@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of the per-message CPU spent preparing forwarded copies.
+
+Compares building the author/guild parts and the embed for every target channel, as forwarding used to,
+with one payload per message from the (user, guild) parts cache and one shared embed:
+
+    pipenv run python -m bench.render --copies 1,3,15 --messages 20000
+"""
+import argparse
+import os
+import random
+import time
+
+COLUMNS = ['copies', 'per_copy_us', 'shared_us', 'saved_us', 'speedup']
+
+
+def setup_environment() -> None:
+    os.environ.setdefault('DISCORD_API_TOKEN', 'bench')
+    os.environ.setdefault('MONGODB_HOST', 'localhost')
+    os.environ.setdefault('MONGODB_PORT', '27017')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+
+def make_messages(count: int, users: int, seed: int) -> list:
+    import discord
+    from bench.fakes import FakeDiscord, FakeMessage, next_snowflake
+
+    # like discord.Guild, builds the icon asset on every access
+    class Guild:
+        id = 1
+        name = 'bench'
+
+        @property
+        def icon(self) -> discord.Asset:
+            return discord.Asset._from_guild_icon(None, self.id, 'b' * 32)
+
+    layer = FakeDiscord(0)
+    guild = Guild()
+    channel = layer.add_channel(next_snowflake(), guild)
+    authors = [
+        discord.User(state=None, data={
+            'id': str(i), 'username': f'user-{i}', 'discriminator': '0', 'avatar': 'a' * 32, 'global_name': f'User {i}'
+        })
+        for i in range(users)
+    ]
+    rnd = random.Random(seed)
+    return [
+        FakeMessage(next_snowflake(), f'message {i}', rnd.choice(authors), channel, guild)
+        for i in range(count)
+    ]
+
+
+def per_copy(message, copies: int) -> None:
+    import discord
+    from bot.render import get_user_color
+
+    # what forwarding did for every target channel
+    for _ in range(copies):
+        embed = discord.Embed(description=message.content, color=get_user_color(message.author))
+        embed.set_author(name=message.author.name, icon_url=message.author.display_avatar.url, url=message.jump_url)
+        embed.set_footer(text=f'Server: {message.guild.name}', icon_url=message.guild.icon.url)
+        embed.set_thumbnail(url=message.jump_url)
+
+
+def shared(message, copies: int) -> None:
+    from bot.main import build_payload
+    from bot.render import embed_cache
+
+    payload = build_payload(message)
+    for _ in range(copies):
+        embed_cache.get(payload)
+
+
+def measure(func, messages: list, copies: int) -> float:
+    started = time.perf_counter()
+    for message in messages:
+        func(message, copies)
+    return (time.perf_counter() - started) / len(messages) * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--copies', default='1,3,15', help='target channels per message, comma-separated values')
+    parser.add_argument('--messages', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    setup_environment()
+    messages = make_messages(args.messages, args.users, args.seed)
+    # warm-up, fills the parts cache like a running bot has it
+    measure(shared, messages[:args.users * 10], 1)
+
+    print(' '.join(f'{column:>12}' for column in COLUMNS))
+    for copies in [int(value) for value in args.copies.split(',')]:
+        before = measure(per_copy, messages, copies)
+        after = measure(shared, messages, copies)
+        row = [copies, f'{before:.1f}', f'{after:.1f}', f'{before - after:.1f}', f'{before / after:.2f}x']
+        print(' '.join(f'{value:>12}' for value in row))
+
+
+if __name__ == '__main__':
+    main()
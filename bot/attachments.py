@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import aiohttp
+
+from bot import db
+from bot.cache import LruCache
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+# Bounded on-disk spool of forwarded attachments, stored once per content hash.
+# Every attachment is downloaded once, streamed to disk, and uploaded to each target from the file.
+class AttachmentSpool:
+    def __init__(self, directory: str, max_bytes: int, max_file_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.used_bytes = 0
+        # content hash -> file size, least recently used first
+        self._files: OrderedDict[str, int] = OrderedDict()
+        # attachment id -> content hash
+        self._hashes: LruCache[int, str] = LruCache(100_000)
+        self._downloads: dict[int, asyncio.Future[str]] = {}
+        self._session: aiohttp.ClientSession | None = None
+
+    def load(self) -> None:
+        """Picks up files spooled before a restart, so the size bound holds across restarts."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.'):
+                # partial download of a previous run
+                os.remove(path)
+                continue
+            self._files[name] = os.path.getsize(path)
+            self.used_bytes += self._files[name]
+        self._evict()
+        logger.info(f'Loaded {len(self._files)} spooled attachments, {self.used_bytes} bytes')
+
+    def path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, content_hash)
+
+    async def fetch(self, attachment: db.AttachmentRef) -> str:
+        """Returns the spooled file of the attachment, downloading it unless it's spooled or being downloaded."""
+        if attachment.size > self.max_file_bytes:
+            raise AttachmentTooLarge(f'Attachment {attachment.id} has {attachment.size} bytes')
+
+        content_hash = self._hashes.get(attachment.id)
+        if content_hash is not None and content_hash in self._files:
+            self._files.move_to_end(content_hash)
+            return self.path(content_hash)
+
+        download = self._downloads.get(attachment.id)
+        if download is None:
+            download = self._downloads[attachment.id] = asyncio.ensure_future(self._download(attachment))
+            download.add_done_callback(lambda _: self._downloads.pop(attachment.id, None))
+        return self.path(await asyncio.shield(download))
+
+    async def _download(self, attachment: db.AttachmentRef) -> str:
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(prefix='.', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                async with self._session.get(attachment.url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            raise AttachmentTooLarge(f'Attachment {attachment.id} exceeds {self.max_file_bytes} bytes')
+                        digest.update(chunk)
+                        file.write(chunk)
+
+            content_hash = digest.hexdigest()
+            if content_hash in self._files:
+                # same content re-posted or bridged again, keep the spooled file
+                os.remove(tmp_path)
+                self._files.move_to_end(content_hash)
+            else:
+                shutil.move(tmp_path, self.path(content_hash))
+                self._files[content_hash] = size
+                self.used_bytes += size
+                self._evict(keep=content_hash)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._hashes.put(attachment.id, content_hash)
+        logger.debug('Spooled attachment %s as %s, %s bytes', attachment.id, content_hash, size)
+        return content_hash
+
+    def _evict(self, keep: str | None = None) -> None:
+        # files already opened for an upload stay readable after removal
+        while self.used_bytes > self.max_bytes and self._files:
+            content_hash, size = next(iter(self._files.items()))
+            if content_hash == keep:
+                break
+            del self._files[content_hash]
+            self.used_bytes -= size
+            try:
+                os.remove(self.path(content_hash))
+            except FileNotFoundError:
+                pass
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,170 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+import discord
+
+from bot import db
+from bot.delivery import Outbox
+from bot.routing import routing_index
+from env import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def fetch_history(
+        channel: discord.abc.Messageable,
+        limit: int,
+        after: discord.abc.Snowflake | None,
+        before: discord.abc.Snowflake,
+        skip: Callable[[discord.Message], bool]
+) -> list[discord.Message]:
+    """The newest `limit` messages of the channel between `after` and `before` not skipped, oldest first."""
+    messages = []
+    # history pages through the channel 100 messages per request, newest first
+    async for message in channel.history(limit=None, after=after, before=before, oldest_first=False):
+        if skip(message):
+            continue
+        messages.append(message)
+        if len(messages) >= limit:
+            break
+    messages.reverse()
+    return messages
+
+
+def merge_newest(histories: list[list[discord.Message]], limit: int) -> list[discord.Message]:
+    """Merges histories sorted by id into one timeline, keeps its newest `limit` messages."""
+    merged = list(heapq.merge(*histories, key=lambda message: message.id))
+    return merged[-limit:] if limit > 0 else []
+
+
+# Forwards earlier messages of a bridge to a channel that joins it, jobs are stored and resumed after a restart
+class Backfiller:
+    def __init__(
+            self,
+            outbox: Outbox,
+            get_channel: Callable[[int], Awaitable[discord.abc.GuildChannel | None]],
+            skip: Callable[[discord.Message], bool],
+            new_delivery: Callable[[str, discord.Message, int], Awaitable[db.Delivery]],
+            deliver: Callable[[db.Delivery], Awaitable[None]]
+    ):
+        self.outbox = outbox
+        self.get_channel = get_channel
+        self.skip = skip
+        self.new_delivery = new_delivery
+        self.deliver = deliver
+        # running jobs by id
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    @property
+    def batch_size(self) -> int:
+        # a batch is leased in one outbox write, so it has to be sent well within the lease
+        per_lease = self.outbox.lease.total_seconds() / 2 / max(settings.backfill_send_interval_seconds, 0.001)
+        return max(1, min(settings.backfill_batch_size, int(per_lease)))
+
+    async def start(self, bridge_name: str, channel_id: int, status_channel: discord.abc.Messageable | None) -> None:
+        after_id = None
+        if settings.backfill_hours is not None:
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.backfill_hours)
+            after_id = discord.utils.time_snowflake(cutoff)
+        job = db.BackfillJob(
+            bridge_name=bridge_name,
+            channel_id=channel_id,
+            before_id=discord.utils.time_snowflake(datetime.now(timezone.utc)),
+            after_id=after_id,
+            limit=settings.backfill_limit
+        )
+        if status_channel is not None:
+            status_message = await status_channel.send(
+                f'⏳ Looking for earlier messages of bridge **{bridge_name}**...'
+            )
+            job.status_channel_id = status_message.channel.id
+            job.status_message_id = status_message.id
+        await db.backfill_jobs.create(job)
+        logger.info(f'Started backfill {job.id} of channel {channel_id} from bridge {bridge_name}')
+        self._run_task(job)
+
+    async def resume(self, owned_channel_ids: list[int]) -> None:
+        owned = set(owned_channel_ids)
+        for job in await db.backfill_jobs.get_many(status=db.BackfillStatus.RUNNING.value):
+            if job.channel_id in owned:
+                logger.info(f'Resuming backfill {job.id} at {job.sent}/{job.total} messages')
+                self._run_task(job)
+
+    def _run_task(self, job: db.BackfillJob) -> None:
+        task = self._tasks.get(job.id)
+        if task is not None and not task.done():
+            return
+        self._tasks[job.id] = asyncio.create_task(self._run(job))
+        self._tasks[job.id].add_done_callback(lambda _: self._tasks.pop(job.id, None))
+
+    async def _run(self, job: db.BackfillJob) -> None:
+        try:
+            await self._backfill(job)
+        except Exception:
+            logger.exception(f'Backfill {job.id} of channel {job.channel_id} failed')
+            job.status = db.BackfillStatus.FAILED
+            await db.backfill_jobs.set_fields(job.id, status=job.status)
+        await self._report(job)
+
+    async def _backfill(self, job: db.BackfillJob) -> None:
+        sources = []
+        for channel_id in routing_index.bridge_channel_ids(job.bridge_name):
+            channel = await self.get_channel(channel_id) if channel_id != job.channel_id else None
+            if channel is not None:
+                sources.append(channel)
+
+        # resumed jobs start after the last message they sent
+        after_id = job.last_message_id or job.after_id
+        after = discord.Object(after_id) if after_id is not None else None
+        remaining = job.limit - job.sent
+        histories = [
+            await fetch_history(source, remaining, after, discord.Object(job.before_id), self.skip)
+            for source in sources
+        ]
+        messages = merge_newest(histories, remaining)
+        if job.total is None:
+            job.total = len(messages)
+            await db.backfill_jobs.set_fields(job.id, total=job.total)
+
+        batch_size = self.batch_size
+        for i in range(0, len(messages), batch_size):
+            batch = messages[i:i + batch_size]
+            deliveries = [await self.new_delivery(job.bridge_name, message, job.channel_id) for message in batch]
+            # one outbox write per batch, entries left unsent by a restart are replayed from there
+            for delivery in await self.outbox.enqueue(deliveries, {job.channel_id}):
+                try:
+                    await self.deliver(delivery)
+                except Exception:
+                    # the outbox retries it
+                    logger.warning(f'Backfill delivery {delivery.id} failed')
+                await asyncio.sleep(settings.backfill_send_interval_seconds)
+
+            job.sent += len(batch)
+            job.last_message_id = batch[-1].id
+            await db.backfill_jobs.set_fields(job.id, sent=job.sent, last_message_id=job.last_message_id)
+            await self._report(job)
+
+        job.status = db.BackfillStatus.DONE
+        await db.backfill_jobs.set_fields(job.id, status=job.status)
+        logger.info(f'Backfilled {job.sent} messages to channel {job.channel_id} from bridge {job.bridge_name}')
+
+    async def _report(self, job: db.BackfillJob) -> None:
+        if job.status_message_id is None:
+            return
+        if job.status == db.BackfillStatus.DONE:
+            text = f'✅ Forwarded {job.sent} earlier messages of bridge **{job.bridge_name}**.'
+        elif job.status == db.BackfillStatus.FAILED:
+            text = f'❌ Stopped after {job.sent} of {job.total} earlier messages of bridge **{job.bridge_name}**.'
+        else:
+            text = f'⏳ Forwarding earlier messages of bridge **{job.bridge_name}**: {job.sent}/{job.total}'
+        channel = await self.get_channel(job.status_channel_id)
+        if channel is None:
+            return
+        try:
+            await channel.get_partial_message(job.status_message_id).edit(content=text)
+        except discord.HTTPException as e:
+            # progress is best effort
+            logger.debug(f'Failed to report progress of backfill {job.id}: {e}')
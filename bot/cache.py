@@ -0,0 +1,80 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, TypeVar, Generic
+
+KeyT = TypeVar('KeyT')
+ValueT = TypeVar('ValueT')
+
+
+# Bounded LRU cache with optional TTL and hit/miss counters, not thread-safe (event loop only)
+class LruCache(Generic[KeyT, ValueT]):
+    def __init__(self, max_size: int, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[KeyT, tuple[float, ValueT]] = OrderedDict()
+
+    def get(self, key: KeyT, default: ValueT | None = None) -> ValueT | None:
+        entry = self._items.get(key)
+        if entry is None or (self.ttl is not None and time.monotonic() - entry[0] > self.ttl):
+            if entry is not None:
+                del self._items[key]
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: KeyT, value: ValueT) -> None:
+        self._items[key] = (time.monotonic(), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def pop(self, key: KeyT, default: ValueT | None = None) -> ValueT | None:
+        entry = self._items.pop(key, None)
+        return entry[1] if entry is not None else default
+
+    def pop_where(self, predicate: Callable[[KeyT], bool]) -> int:
+        keys = [key for key in self._items if predicate(key)]
+        for key in keys:
+            del self._items[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __contains__(self, key: KeyT) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+# Bloom filter of int keys: no false negatives, false positive rate ~error_rate up to capacity keys
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: int) -> list[int]:
+        digest = hashlib.blake2b(key.to_bytes(8, 'little'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: int) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: int) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
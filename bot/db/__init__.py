@@ -1,25 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from typing import TypeVar
 
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel, ASCENDING, TEXT
 
 from bot.db.base_entity import BaseEntity
 from bot.db.db_manager import DbManager
+from bot.db.async_db_manager import AsyncDbManager
+from bot.db.write_buffer import WriteBuffer
 from bot.db.model import *
 from env import settings
 
-mongo_client = MongoClient(host=settings.mongodb_host, port=settings.mongodb_port)
+mongo_client = MongoClient(
+    host=settings.mongodb_host,
+    port=settings.mongodb_port,
+    maxPoolSize=settings.mongodb_max_workers
+)
+# bounded pool for blocking pymongo calls, keeps them off the event loop
+mongo_executor = ThreadPoolExecutor(max_workers=settings.mongodb_max_workers, thread_name_prefix='mongo')
 
 
 EntityT = TypeVar('EntityT', bound=BaseEntity)
 
 
-def new_collection(name: str, elem_type: type[EntityT], primary_key: str = 'id') -> DbManager[EntityT]:
-    return DbManager[EntityT](name, elem_type, mongo_client[settings.service_name][name], primary_key=primary_key)
+collections: list[AsyncDbManager] = []
+# collections whose expired rows are moved to <collection>_archive when archiving is on
+archived_collections: list[AsyncDbManager] = []
 
 
-users: DbManager[User] = new_collection('users', User)
-servers: DbManager[Server] = new_collection('servers', Server)
-bridge_channels: DbManager[BridgeChannel] = new_collection('bridge_channels', BridgeChannel)
-bridges: DbManager[Bridge] = new_collection('bridges', Bridge, primary_key='name')
-bridge_messages: DbManager[BridgeMessage] = new_collection('bridge_messages', BridgeMessage)
-forwarded_messages: DbManager[ForwardedMessage] = new_collection('forwarded_messages', ForwardedMessage)
+def new_collection(
+        name: str,
+        elem_type: type[EntityT],
+        primary_key: str = 'id',
+        indexes: list[IndexModel] | None = None,
+        retention_days: float | None = None,
+        archived: bool = False
+) -> AsyncDbManager[EntityT]:
+    retention = timedelta(days=retention_days) if retention_days is not None else None
+    ttl = retention
+    if retention is not None and archived and settings.archive_expired_messages:
+        # let the archive job move expired rows first, TTL is only the backstop
+        ttl = retention + timedelta(hours=settings.archive_grace_hours)
+
+    manager = DbManager[EntityT](
+        name,
+        elem_type,
+        mongo_client[settings.service_name][name],
+        primary_key=primary_key,
+        indexes=indexes or [],
+        retention=retention,
+        ttl=ttl
+    )
+    async_manager = AsyncDbManager[EntityT](manager, mongo_executor)
+    collections.append(async_manager)
+    if archived:
+        archived_collections.append(async_manager)
+    return async_manager
+
+
+def index(*keys: str, unique: bool = False) -> IndexModel:
+    return IndexModel([(key, ASCENDING) for key in keys], unique=unique, name='_'.join(keys))
+
+
+users: AsyncDbManager[User] = new_collection('users', User, indexes=[
+    index('id', unique=True),
+])
+servers: AsyncDbManager[Server] = new_collection('servers', Server, indexes=[
+    index('id', unique=True),
+])
+bridge_channels: AsyncDbManager[BridgeChannel] = new_collection('bridge_channels', BridgeChannel, indexes=[
+    index('id', 'bridge_name', unique=True),
+    index('bridge_name'),
+])
+bridges: AsyncDbManager[Bridge] = new_collection('bridges', Bridge, primary_key='name', indexes=[
+    index('name', unique=True),
+    index('creator_id'),
+])
+bridge_messages: AsyncDbManager[BridgeMessage] = new_collection(
+    'bridge_messages',
+    BridgeMessage,
+    indexes=[
+        index('id', 'bridge_name', unique=True),
+        # last bridged message of a channel, where catching up after a restart starts
+        index('channel_id', 'id'),
+        # /search_bridge, the bridge_name prefix limits a search to the bridge's part of the index.
+        # No language, so words of every language are matched as written, without stemming or stop words
+        IndexModel(
+            [('bridge_name', ASCENDING), ('text', TEXT), ('created', ASCENDING)],
+            name='bridge_name_text_created',
+            default_language='none'
+        ),
+    ],
+    retention_days=settings.bridge_messages_retention_days,
+    archived=True
+)
+forwarded_messages: AsyncDbManager[ForwardedMessage] = new_collection(
+    'forwarded_messages',
+    ForwardedMessage,
+    indexes=[
+        # a merged copy has one row per original
+        index('id', 'original_id', unique=True),
+        # all copies of an original, for edit and delete propagation
+        index('original_id'),
+    ],
+    retention_days=settings.forwarded_messages_retention_days,
+    archived=True
+)
+channel_webhooks: AsyncDbManager[ChannelWebhook] = new_collection('channel_webhooks', ChannelWebhook, indexes=[
+    index('id', unique=True),
+])
+deliveries: AsyncDbManager[Delivery] = new_collection(
+    'deliveries',
+    Delivery,
+    indexes=[
+        index('id', unique=True),
+        # claims filter on status, channel and lease and take the oldest first: equality, sort, then range keys
+        index('status', 'channel_id', 'created', 'lease_until'),
+        index('lease_token'),
+    ],
+    # sent entries are kept as idempotency keys until then
+    retention_days=settings.outbox_retention_hours / 24
+)
+backfill_jobs: AsyncDbManager[BackfillJob] = new_collection('backfill_jobs', BackfillJob, indexes=[
+    index('id', unique=True),
+    # running jobs are resumed on ready
+    index('status'),
+])
+
+
+def new_write_buffer(manager: AsyncDbManager[EntityT]) -> WriteBuffer[EntityT]:
+    return WriteBuffer[EntityT](manager, settings.write_buffer_max_size, settings.write_buffer_flush_seconds)
+
+
+bridge_messages_buffer: WriteBuffer[BridgeMessage] = new_write_buffer(bridge_messages)
+forwarded_messages_buffer: WriteBuffer[ForwardedMessage] = new_write_buffer(forwarded_messages)
+write_buffers: list[WriteBuffer] = [bridge_messages_buffer, forwarded_messages_buffer]
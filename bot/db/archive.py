@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+
+import bson
+from bson import Binary
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+
+from bot import db
+from env import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Moves rows older than the collection retention into <collection>_archive, zlib-compressed BSON batches
+@dataclass
+class Archiver:
+    manager: db.AsyncDbManager
+    archive: Collection
+    batch_size: int
+
+    def archive_expired(self) -> int:
+        collection = self.manager.sync.collection
+        cutoff = datetime.utcnow() - self.manager.sync.retention
+        archived = 0
+        while True:
+            docs = list(
+                collection.find({'created': {'$lt': cutoff}}).sort('created', ASCENDING).limit(self.batch_size)
+            )
+            if not docs:
+                return archived
+
+            self.archive.insert_one({
+                'from': docs[0]['created'],
+                'to': docs[-1]['created'],
+                'count': len(docs),
+                'data': Binary(zlib.compress(bson.encode({'docs': docs}))),
+                'created': datetime.utcnow()
+            })
+            collection.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+            archived += len(docs)
+
+    @staticmethod
+    def unpack(archive_doc: dict) -> list[dict]:
+        return bson.decode(zlib.decompress(archive_doc['data']))['docs']
+
+
+def new_archivers() -> list[Archiver]:
+    return [
+        Archiver(manager, manager.sync.collection.database[f'{manager.name}_archive'], settings.archive_batch_size)
+        for manager in db.archived_collections
+        if manager.sync.retention is not None
+    ]
+
+
+async def archive_periodically(archivers: list[Archiver], interval_seconds: float) -> None:
+    while True:
+        for archiver in archivers:
+            try:
+                archived = await archiver.manager.run(archiver.archive_expired)
+                if archived:
+                    logger.info(f'Archived {archived} expired {archiver.manager.name}')
+            except Exception:
+                logger.exception(f'Failed to archive expired {archiver.manager.name}')
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,110 @@
+import asyncio
+import functools
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import TypeVar, Generic, Any, Callable
+
+from bot.db.db_manager import DbManager
+from bot.metrics import DB_SECONDS
+
+EntityT = TypeVar('EntityT', bound='BaseEntity')
+ResultT = TypeVar('ResultT')
+
+
+# Same API as DbManager, but every pymongo call runs on the executor instead of the event loop
+@dataclass
+class AsyncDbManager(Generic[EntityT]):
+    sync: DbManager[EntityT]
+    executor: Executor
+
+    @property
+    def name(self) -> str:
+        return self.sync.name
+
+    @property
+    def elem_type(self) -> Any:
+        return self.sync.elem_type
+
+    @property
+    def primary_key(self) -> str:
+        return self.sync.primary_key
+
+    async def run(self, func: Callable[..., ResultT], *args, **kwargs) -> ResultT:
+        loop = asyncio.get_running_loop()
+        with DB_SECONDS.labels(self.name, getattr(func, '__name__', 'call')).time():
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def ensure_indexes(self) -> list[str]:
+        return await self.run(self.sync.ensure_indexes)
+
+    async def create(self, item: EntityT) -> EntityT:
+        return await self.run(self.sync.create, item)
+
+    async def create_many(self, items: list[EntityT]) -> list[EntityT]:
+        return await self.run(self.sync.create_many, items)
+
+    async def create_with(self, **kwargs) -> EntityT:
+        return await self.run(self.sync.create_with, **kwargs)
+
+    async def get_one(self, **kwargs) -> EntityT | None:
+        return await self.run(self.sync.get_one, **kwargs)
+
+    async def get_by_primary_key(self, val: Any, throw_ex: bool = True) -> EntityT:
+        return await self.run(self.sync.get_by_primary_key, val, throw_ex=throw_ex)
+
+    async def get_or_create(self, item: EntityT) -> EntityT:
+        return await self.run(self.sync.get_or_create, item)
+
+    async def get_or_create_with(self, **kwargs) -> EntityT:
+        return await self.run(self.sync.get_or_create_with, **kwargs)
+
+    async def get_many(self, **kwargs) -> list[EntityT]:
+        return await self.run(self.sync.get_many, **kwargs)
+
+    async def get_last(self, sort_key: str, **kwargs) -> EntityT | None:
+        return await self.run(self.sync.get_last, sort_key, **kwargs)
+
+    async def get_projected(self, fields: list[str], **kwargs) -> list[dict[str, Any]]:
+        return await self.run(self.sync.get_projected, fields, **kwargs)
+
+    async def get_by_array(self, field_name: str, values: list[Any]) -> list[EntityT]:
+        return await self.run(self.sync.get_by_array, field_name, values)
+
+    async def get_all(self) -> list[EntityT]:
+        return await self.run(self.sync.get_all)
+
+    async def count(self) -> int:
+        return await self.run(self.sync.count)
+
+    async def update(self, item: EntityT) -> EntityT:
+        return await self.run(self.sync.update, item)
+
+    async def update_with(self, item: EntityT, **kwargs) -> EntityT:
+        return await self.run(self.sync.update_with, item, **kwargs)
+
+    async def modify(self, key: Any, update: dict[str, Any]) -> EntityT | None:
+        return await self.run(self.sync.modify, key, update)
+
+    async def set_fields(self, key: Any, **fields) -> EntityT | None:
+        return await self.run(self.sync.set_fields, key, **fields)
+
+    async def push(self, key: Any, field_name: str, value: Any) -> EntityT | None:
+        return await self.run(self.sync.push, key, field_name, value)
+
+    async def add_to_set(self, key: Any, field_name: str, value: Any) -> EntityT | None:
+        return await self.run(self.sync.add_to_set, key, field_name, value)
+
+    async def pull(self, key: Any, field_name: str, value: Any) -> EntityT | None:
+        return await self.run(self.sync.pull, key, field_name, value)
+
+    async def inc(self, key: Any, field_name: str, amount: int | float = 1) -> EntityT | None:
+        return await self.run(self.sync.inc, key, field_name, amount)
+
+    async def remove(self, item: EntityT) -> None:
+        return await self.run(self.sync.remove, item)
+
+    async def remove_by(self, **kwargs) -> int:
+        return await self.run(self.sync.remove_by, **kwargs)
+
+    def from_dict(self, item_dict: dict | None = None) -> EntityT | None:
+        return self.sync.from_dict(item_dict)
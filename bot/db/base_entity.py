@@ -3,11 +3,15 @@ from datetime import datetime
 
 from typing import Any, TypeVar, Generic, get_args
 
+from bot.db.codec import codec_for
+
 EntityT = TypeVar('EntityT')
 
 
-# MUST be dataclass and dataclass_json
+# MUST be dataclass, with slots=True to keep instances small
 class BaseEntity(Generic[EntityT]):
+    __slots__ = ()
+
     @abstractmethod
     def id(self) -> str | int:
         pass
@@ -22,10 +26,10 @@ class BaseEntity(Generic[EntityT]):
 
     @classmethod
     def from_dict(cls, data: dict) -> EntityT:
-        return cls.from_dict(data)
+        return codec_for(cls).decode(data)
 
-    def to_dict(self):
-        return self.to_dict()
+    def to_dict(self) -> dict:
+        return codec_for(type(self)).encode(self)
 
     def field(self, name: str, default_factory: callable = None) -> Any:
         res = getattr(self, name)
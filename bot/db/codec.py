@@ -0,0 +1,112 @@
+import dataclasses
+import enum
+import types
+import typing
+from datetime import datetime, timezone
+from typing import Any, Callable, Generic, TypeVar
+
+T = TypeVar('T')
+
+Converter = Callable[[Any], Any]
+
+_codecs: dict[type, 'Codec'] = {}
+
+
+def codec_for(cls: type[T]) -> 'Codec[T]':
+    codec = _codecs.get(cls)
+    if codec is None:
+        codec = _codecs[cls] = Codec(cls)
+    return codec
+
+
+def decode_datetime(value: Any) -> datetime:
+    # rows written as timestamps by older encoders
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    return value
+
+
+def unwrap_optional(tp: Any) -> Any:
+    if typing.get_origin(tp) in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(tp) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return tp
+
+
+def converters(tp: Any) -> tuple[Converter | None, Converter | None]:
+    """Decoder and encoder of a field type, None where the Mongo value is used as is."""
+    tp = unwrap_optional(tp)
+    if tp is datetime:
+        return decode_datetime, None
+    if isinstance(tp, type) and issubclass(tp, enum.Enum):
+        return tp, lambda member: member.value
+    if dataclasses.is_dataclass(tp):
+        codec = codec_for(tp)
+        return codec.decode, codec.encode
+    if typing.get_origin(tp) is list:
+        args = typing.get_args(tp)
+        decode, encode = converters(args[0]) if args else (None, None)
+        return (
+            list if decode is None else lambda values: [decode(v) for v in values],
+            list if encode is None else lambda values: [encode(v) for v in values]
+        )
+    return None, None
+
+
+# Compiled codec of a dataclass: straight-line encode/decode functions generated once per class from its fields,
+# with the converters of nested dataclasses, lists and datetimes precomputed
+class Codec(Generic[T]):
+    def __init__(self, cls: type[T]):
+        self.cls = cls
+        self.fields = [f.name for f in dataclasses.fields(cls)]
+        hints = typing.get_type_hints(cls)
+        self.decoders: dict[str, Converter | None] = {}
+        self.encoders: dict[str, Converter | None] = {}
+        for name in self.fields:
+            self.decoders[name], self.encoders[name] = converters(hints[name])
+        self.decode: Callable[[dict], T] = self._compile_decode()
+        self.encode: Callable[[T], dict] = self._compile_encode()
+
+    def _compile_decode(self) -> Callable[[dict], T]:
+        namespace: dict[str, Any] = {'cls': self.cls}
+        lines = ['def decode(doc):', '    kwargs = {}']
+        for i, name in enumerate(self.fields):
+            lines.append(f'    if {name!r} in doc:')
+            decoder = self.decoders[name]
+            if decoder is None:
+                lines.append(f'        kwargs[{name!r}] = doc[{name!r}]')
+            else:
+                namespace[f'decode_{i}'] = decoder
+                lines.append(f'        value = doc[{name!r}]')
+                lines.append(f'        kwargs[{name!r}] = None if value is None else decode_{i}(value)')
+        lines.append('    return cls(**kwargs)')
+        exec('\n'.join(lines), namespace)
+        return namespace['decode']
+
+    def _compile_encode(self) -> Callable[[T], dict]:
+        namespace: dict[str, Any] = {}
+        lines = ['def encode(item):']
+        for i, name in enumerate(self.fields):
+            encoder = self.encoders[name]
+            if encoder is not None:
+                namespace[f'encode_{i}'] = encoder
+                lines.append(f'    value_{i} = item.{name}')
+        items = []
+        for i, name in enumerate(self.fields):
+            if self.encoders[name] is None:
+                items.append(f'{name!r}: item.{name}')
+            else:
+                items.append(f'{name!r}: None if value_{i} is None else encode_{i}(value_{i})')
+        lines.append('    return {' + ', '.join(items) + '}')
+        exec('\n'.join(lines), namespace)
+        return namespace['encode']
+
+    def decode_fields(self, doc: dict, fields: list[str]) -> dict[str, Any]:
+        """Decodes only the given fields of a projected document, missing fields are None."""
+        values = {}
+        for name in fields:
+            value = doc.get(name)
+            decoder = self.decoders[name]
+            values[name] = value if decoder is None or value is None else decoder(value)
+        return values
@@ -1,11 +1,21 @@
-from dataclasses import dataclass
-from datetime import datetime
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 
+from pymongo import IndexModel, ASCENDING, DESCENDING, ReturnDocument
 from pymongo.collection import Collection
 from typing import TypeVar, Generic, Any
 
+from bot.db.codec import Codec, codec_for
+
+logger = logging.getLogger(__name__)
+
 EntityT = TypeVar('EntityT', bound='BaseEntity')
 
+TTL_INDEX_NAME = 'created_ttl'
+# kept by Mongo on every collection
+ID_INDEX_NAME = '_id_'
+
 
 @dataclass
 class DbManager(Generic[EntityT]):
@@ -13,11 +23,64 @@ class DbManager(Generic[EntityT]):
     elem_type: Any
     collection: Collection
     primary_key: str = 'id'
+    indexes: list[IndexModel] = field(default_factory=list)
+    # how long rows are kept, and when Mongo's TTL monitor removes them by `created`
+    retention: timedelta | None = None
+    ttl: timedelta | None = None
+    codec: Codec[EntityT] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.codec = codec_for(self.elem_type)
+
+    def ensure_indexes(self) -> list[str]:
+        self.drop_obsolete_indexes()
+        names = self.collection.create_indexes(self.indexes) if self.indexes else []
+        self.ensure_ttl_index()
+        return names
+
+    def drop_obsolete_indexes(self) -> list[str]:
+        """Drops indexes no longer declared or declared with another uniqueness, they'd reject rows still."""
+        declared = {index.document['name']: index.document for index in self.indexes}
+        dropped = []
+        for name, info in self.collection.index_information().items():
+            if name in (ID_INDEX_NAME, TTL_INDEX_NAME):
+                continue
+            document = declared.get(name)
+            if document is None or document.get('unique', False) != info.get('unique', False):
+                self.collection.drop_index(name)
+                dropped.append(name)
+        if dropped:
+            logger.info(f'Dropped obsolete indexes {dropped} of {self.name}')
+        return dropped
+
+    def ensure_ttl_index(self) -> None:
+        existing = self.collection.index_information().get(TTL_INDEX_NAME)
+        if self.ttl is None:
+            if existing is not None:
+                self.collection.drop_index(TTL_INDEX_NAME)
+            return
+
+        expire_after_seconds = int(self.ttl.total_seconds())
+        if existing is None:
+            self.collection.create_index(
+                [('created', ASCENDING)], name=TTL_INDEX_NAME, expireAfterSeconds=expire_after_seconds
+            )
+        elif existing.get('expireAfterSeconds') != expire_after_seconds:
+            self.collection.database.command(
+                'collMod',
+                self.collection.name,
+                index={'name': TTL_INDEX_NAME, 'expireAfterSeconds': expire_after_seconds}
+            )
 
     def create(self, item: EntityT) -> EntityT:
-        self.collection.insert_one(item.to_dict())
+        self.collection.insert_one(self.codec.encode(item))
         return item
 
+    def create_many(self, items: list[EntityT]) -> list[EntityT]:
+        if items:
+            self.collection.insert_many([self.codec.encode(item) for item in items], ordered=False)
+        return items
+
     def create_with(self, **kwargs) -> EntityT:
         item = self.elem_type(**kwargs)
         return self.create(item)
@@ -33,7 +96,7 @@ class DbManager(Generic[EntityT]):
         return res
 
     def get_or_create(self, item: EntityT) -> EntityT:
-        item_dict = item.to_dict()
+        item_dict = self.codec.encode(item)
         res = self.get_by_primary_key(item_dict.get(self.primary_key), throw_ex=False)
         if res is None:
             res = self.create(item)
@@ -46,8 +109,18 @@ class DbManager(Generic[EntityT]):
         return res
 
     def get_many(self, **kwargs) -> list[EntityT]:
-        items = self.collection.find(kwargs)
-        return [self.elem_type.from_dict(i) for i in items]
+        decode = self.codec.decode
+        return [decode(i) for i in self.collection.find(kwargs)]
+
+    def get_last(self, sort_key: str, **kwargs) -> EntityT | None:
+        item_dict = self.collection.find_one(kwargs, sort=[(sort_key, DESCENDING)])
+        return self.from_dict(item_dict)
+
+    def get_projected(self, fields: list[str], **kwargs) -> list[dict[str, Any]]:
+        """Fetches and decodes only the given fields, for hot reads that don't need whole entities."""
+        projection = {name: 1 for name in fields}
+        projection['_id'] = 0
+        return [self.codec.decode_fields(i, fields) for i in self.collection.find(kwargs, projection)]
 
     def get_by_array(self, field_name: str, values: list[Any]) -> list[EntityT]:
         return self.get_many(**{field_name: {'$in': values}})
@@ -59,24 +132,51 @@ class DbManager(Generic[EntityT]):
         return self.collection.count_documents({})
 
     def update(self, item: EntityT) -> EntityT:
-        item.last_updated = datetime.utcnow()
-        item_dict = item.to_dict()
+        item.updated = datetime.utcnow()
+        item_dict = self.codec.encode(item)
         self.collection.update_one(
             {self.primary_key: item_dict.get(self.primary_key)}, {'$set': item_dict}
         )
         return item
 
     def update_with(self, item: EntityT, **kwargs) -> EntityT:
-        item.last_updated = datetime.utcnow()
-        item_dict = item.to_dict()
+        item.updated = datetime.utcnow()
+        item_dict = self.codec.encode(item)
         item_dict.update(kwargs)
         self.collection.update_one(
             {self.primary_key: item_dict.get(self.primary_key)}, {'$set': item_dict}
         )
         return self.from_dict(item_dict)
 
+    def modify(self, key: Any, update: dict[str, Any]) -> EntityT | None:
+        """Applies a field-level update atomically, returns the updated entity or None if there is none with the key."""
+        update.setdefault('$set', {})['updated'] = datetime.utcnow()
+        item_dict = self.collection.find_one_and_update(
+            {self.primary_key: key}, update, return_document=ReturnDocument.AFTER
+        )
+        return self.from_dict(item_dict)
+
+    def set_fields(self, key: Any, **fields) -> EntityT | None:
+        encoded = {}
+        for name, value in fields.items():
+            encoder = self.codec.encoders[name]
+            encoded[name] = value if encoder is None or value is None else encoder(value)
+        return self.modify(key, {'$set': encoded})
+
+    def push(self, key: Any, field_name: str, value: Any) -> EntityT | None:
+        return self.modify(key, {'$push': {field_name: value}})
+
+    def add_to_set(self, key: Any, field_name: str, value: Any) -> EntityT | None:
+        return self.modify(key, {'$addToSet': {field_name: value}})
+
+    def pull(self, key: Any, field_name: str, value: Any) -> EntityT | None:
+        return self.modify(key, {'$pull': {field_name: value}})
+
+    def inc(self, key: Any, field_name: str, amount: int | float = 1) -> EntityT | None:
+        return self.modify(key, {'$inc': {field_name: amount}})
+
     def remove(self, item: EntityT) -> None:
-        item_dict = item.to_dict()
+        item_dict = self.codec.encode(item)
         self.collection.delete_one(
             {self.primary_key: item_dict.get(self.primary_key)}
         )
@@ -87,4 +187,4 @@ class DbManager(Generic[EntityT]):
         return res.deleted_count
 
     def from_dict(self, item_dict: dict | None = None) -> EntityT | None:
-        return self.elem_type.from_dict(item_dict) if item_dict is not None else None
+        return self.codec.decode(item_dict) if item_dict is not None else None
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any
+
+from pymongo import ASCENDING, DESCENDING
+
+from bot import db
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryShape:
+    manager: db.AsyncDbManager
+    query: dict[str, Any]
+    sort: list[tuple[str, int]] | None = None
+
+
+# filters and sorts the bot actually runs, values are placeholders of the right type
+QUERY_SHAPES: list[QueryShape] = [
+    QueryShape(db.users, {'id': 0}),
+    QueryShape(db.servers, {'id': 0}),
+    QueryShape(db.bridges, {'name': ''}),
+    QueryShape(db.bridges, {'creator_id': 0}),
+    QueryShape(db.bridge_channels, {'id': 0, 'bridge_name': ''}),
+    QueryShape(db.bridge_channels, {'bridge_name': ''}),
+    QueryShape(db.bridge_messages, {'channel_id': 0}),
+    # last forwarded message of a channel, for catch-up
+    QueryShape(db.bridge_messages, {'channel_id': 0}, [('id', DESCENDING)]),
+    QueryShape(db.bridge_messages, {'bridge_name': '', '$text': {'$search': 'query'}, 'created': {'$gte': 0}}),
+    QueryShape(db.forwarded_messages, {'id': 0}),
+    QueryShape(db.forwarded_messages, {'original_id': 0}),
+    # outbox claims, oldest first
+    QueryShape(
+        db.deliveries, {'status': '', 'channel_id': {'$in': [0]}, 'lease_until': {'$lte': 0}}, [('created', ASCENDING)]
+    ),
+    QueryShape(db.deliveries, {'lease_token': ''}),
+    QueryShape(db.backfill_jobs, {'status': ''}),
+]
+
+
+@dataclass
+class QueryPlan:
+    collection: str
+    query: dict[str, Any]
+    sort: list[tuple[str, int]] | None
+    stages: list[str]
+
+    @property
+    def index_backed(self) -> bool:
+        # SORT is a blocking in-memory sort, the index serves the filter but not the order
+        return 'COLLSCAN' not in self.stages and 'SORT' not in self.stages
+
+
+def plan_stages(plan: Any) -> list[str]:
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in plan_stages(item)]
+    if not isinstance(plan, dict):
+        return []
+    stages = [plan['stage']] if 'stage' in plan else []
+    for key, val in plan.items():
+        if key != 'stage':
+            stages += plan_stages(val)
+    return stages
+
+
+def explain(shape: QueryShape) -> QueryPlan:
+    cursor = shape.manager.sync.collection.find(shape.query)
+    if shape.sort:
+        cursor = cursor.sort(shape.sort)
+    winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+    return QueryPlan(shape.manager.name, shape.query, shape.sort, plan_stages(winning_plan))
+
+
+async def check_query_plans() -> list[QueryPlan]:
+    """Runs explain() on every known query shape, returns the plans that scan the whole collection."""
+    loop = asyncio.get_running_loop()
+    plans = await asyncio.gather(*[loop.run_in_executor(db.mongo_executor, explain, s) for s in QUERY_SHAPES])
+    for plan in plans:
+        if plan.index_backed:
+            logger.info(f'Query {plan.collection} {plan.query} sort {plan.sort} is index-backed: {plan.stages}')
+        else:
+            logger.warning(f'Query {plan.collection} {plan.query} sort {plan.sort} is NOT index-backed: {plan.stages}')
+    return [plan for plan in plans if not plan.index_backed]
+
+
+async def main():
+    unindexed = await check_query_plans()
+    print(f'{len(QUERY_SHAPES) - len(unindexed)}/{len(QUERY_SHAPES)} query shapes are index-backed.')
+    for plan in unindexed:
+        print(f'  {plan.collection} {plan.query} sort {plan.sort}: {plan.stages}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
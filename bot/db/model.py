@@ -1,15 +1,14 @@
+import enum
 from dataclasses import dataclass, field
 from datetime import datetime
 
 import discord
-from dataclasses_json import dataclass_json
 
 from bot.db import BaseEntity
 from bot.util import get_uuid
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class Colour:
     value: int
 
@@ -20,8 +19,7 @@ class Colour:
         return cls(colour.value)
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class User(BaseEntity['User']):
     name: str
     display_name: str
@@ -33,8 +31,7 @@ class User(BaseEntity['User']):
     updated: datetime = field(default_factory=datetime.utcnow)
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class Server(BaseEntity['Server']):
     name: str
 
@@ -43,8 +40,7 @@ class Server(BaseEntity['Server']):
     updated: datetime = field(default_factory=datetime.utcnow)
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class BridgeChannel(BaseEntity['BridgeChannel']):
     name: str
     bridge_name: str
@@ -56,20 +52,20 @@ class BridgeChannel(BaseEntity['BridgeChannel']):
     updated: datetime = field(default_factory=datetime.utcnow)
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class Bridge(BaseEntity['Bridge']):
     name: str
     creator_id: int
     channel_ids: list[int] = field(default_factory=list)
+    # consecutive copies to a channel within this window are merged into one message, unset sends each
+    coalesce_seconds: float | None = None
 
     id: str = field(default_factory=get_uuid)
     created: datetime = field(default_factory=datetime.utcnow)
     updated: datetime = field(default_factory=datetime.utcnow)
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class BridgeMessage(BaseEntity['BridgeMessage']):
     text: str
     author_id: int
@@ -77,12 +73,25 @@ class BridgeMessage(BaseEntity['BridgeMessage']):
     bridge_name: str
 
     id: int
+    # all bridges of the source channel the message was forwarded to, bridge_name is the first one
+    bridge_names: list[str] = field(default_factory=list)
+    # for jump links to the message, unset on rows written before it was stored
+    guild_id: int | None = None
     created: datetime = field(default_factory=datetime.utcnow)
     updated: datetime = field(default_factory=datetime.utcnow)
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
+class ChannelWebhook(BaseEntity['ChannelWebhook']):
+    webhook_id: int
+    token: str
+
+    id: int
+    created: datetime = field(default_factory=datetime.utcnow)
+    updated: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass(slots=True)
 class ForwardedMessage(BaseEntity['ForwardedMessage']):
     original_id: int
     original_channel_id: int
@@ -90,5 +99,94 @@ class ForwardedMessage(BaseEntity['ForwardedMessage']):
     bridge_name: str
 
     id: int
+    # all bridges the copy was sent for, one copy serves every bridge the two channels share
+    bridge_names: list[str] = field(default_factory=list)
+    # set when the copy was posted through the channel webhook
+    webhook_id: int | None = None
+    # the copy is a burst of several originals, one row per original
+    merged: bool = False
+    created: datetime = field(default_factory=datetime.utcnow)
+    updated: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass(slots=True)
+class AttachmentRef:
+    id: int
+    filename: str
+    url: str
+    size: int
+
+
+# everything needed to post a copy of a message, so any shard process can deliver it
+@dataclass(slots=True)
+class ForwardPayload:
+    message_id: int
+    channel_id: int
+    content: str
+    jump_url: str
+    author_id: int
+    author_name: str
+    author_display_name: str
+    author_avatar_url: str
+    colour: Colour
+    guild_name: str
+    guild_icon_url: str | None = None
+    reference_message_id: int | None = None
+    reference_channel_id: int | None = None
+    attachments: list[AttachmentRef] = field(default_factory=list)
+
+
+class DeliveryStatus(str, enum.Enum):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+
+# outbox entry of one copy, id is the idempotency key <source message id>:<target channel id>
+@dataclass(slots=True)
+class Delivery(BaseEntity['Delivery']):
+    bridge_name: str
+    channel_id: int
+    payload: ForwardPayload
+
+    id: str
+    # all bridges the copy is sent for, bridge_name is the first one
+    bridge_names: list[str] = field(default_factory=list)
+    status: DeliveryStatus = DeliveryStatus.PENDING
+    attempts: int = 0
+    # stored right before a webhook send, which carries no nonce, so a replay first looks for the posted copy
+    send_started: datetime | None = None
+    # pending entries are claimable by any process once the lease runs out
+    lease_token: str | None = None
+    lease_until: datetime = field(default_factory=datetime.utcnow)
+    created: datetime = field(default_factory=datetime.utcnow)
+    updated: datetime = field(default_factory=datetime.utcnow)
+
+
+class BackfillStatus(str, enum.Enum):
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+# Earlier messages of a bridge's channels sent to a channel that joined it. Messages go out in id order,
+# so the last sent id is where a restarted job resumes
+@dataclass(slots=True)
+class BackfillJob(BaseEntity['BackfillJob']):
+    bridge_name: str
+    channel_id: int
+    # the newest `limit` messages between the two ids, later ones were forwarded live
+    before_id: int
+    after_id: int | None
+    limit: int
+
+    id: str = field(default_factory=get_uuid)
+    status: BackfillStatus = BackfillStatus.RUNNING
+    last_message_id: int | None = None
+    sent: int = 0
+    total: int | None = None
+    # progress message, edited after every batch
+    status_channel_id: int | None = None
+    status_message_id: int | None = None
     created: datetime = field(default_factory=datetime.utcnow)
     updated: datetime = field(default_factory=datetime.utcnow)
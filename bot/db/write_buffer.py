@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import TypeVar, Generic
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from bot.db.async_db_manager import AsyncDbManager
+from bot.metrics import count_writes
+
+logger = logging.getLogger(__name__)
+
+EntityT = TypeVar('EntityT', bound='BaseEntity')
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+# Write-behind buffer: collects inserts and flushes them with insert_many on size or time threshold.
+# Reads through the buffer also see records that are not flushed yet.
+class WriteBuffer(Generic[EntityT]):
+    def __init__(self, manager: AsyncDbManager[EntityT], max_size: int, flush_interval: float):
+        self.manager = manager
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._pending: list[EntityT] = []
+        self._in_flight: list[EntityT] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self._size_flush: asyncio.Task | None = None
+
+    def add(self, item: EntityT) -> EntityT:
+        self._pending.append(item)
+        if len(self._pending) >= self.max_size and (self._size_flush is None or self._size_flush.done()):
+            self._size_flush = asyncio.create_task(self.flush())
+        return item
+
+    def add_many(self, items: list[EntityT]) -> list[EntityT]:
+        for item in items:
+            self.add(item)
+        return items
+
+    def find(self, **kwargs) -> list[EntityT]:
+        return [
+            item for item in self._in_flight + self._pending
+            if all(getattr(item, key) == val for key, val in kwargs.items())
+        ]
+
+    async def get_one(self, **kwargs) -> EntityT | None:
+        buffered = self.find(**kwargs)
+        if buffered:
+            return buffered[0]
+        return await self.manager.get_one(**kwargs)
+
+    async def get_many(self, **kwargs) -> list[EntityT]:
+        return await self.manager.get_many(**kwargs) + self.find(**kwargs)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            self._in_flight = batch
+            try:
+                await self.manager.create_many(batch)
+                count_writes(self.manager.name, (item.bridge_name for item in batch), 'written')
+                logger.debug('Flushed %s %s', len(batch), self.manager.name)
+            except BulkWriteError as e:
+                # unordered insert, everything except the failed rows is written. Duplicates are rows of replayed
+                # messages, written the first time already
+                errors = e.details.get('writeErrors', [])
+                failed = [error for error in errors if error['code'] != DUPLICATE_KEY_ERROR]
+                results = ['written'] * len(batch)
+                for error in errors:
+                    results[error['index']] = 'duplicate' if error['code'] == DUPLICATE_KEY_ERROR else 'failed'
+                for result in set(results):
+                    bridge_names = (item.bridge_name for item, r in zip(batch, results) if r == result)
+                    count_writes(self.manager.name, bridge_names, result)
+                if failed:
+                    logger.error(f'Failed to write {len(failed)} {self.manager.name}: {failed[0]["errmsg"]}')
+                if len(failed) < len(errors):
+                    logger.debug('Skipped %s %s written already', len(errors) - len(failed), self.manager.name)
+            except PyMongoError as e:
+                logger.error(f'Failed to flush {len(batch)} {self.manager.name}, will retry: {e}')
+                self._pending = (batch + self._pending)[-self.max_size * 10:]
+            finally:
+                self._in_flight = []
+
+    def start(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception(f'Periodic flush of {self.manager.name} failed')
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
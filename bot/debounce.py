@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+KeyT = TypeVar('KeyT', bound=Hashable)
+ValueT = TypeVar('ValueT')
+
+
+# Collapses bursts of updates per key: the callback runs once, `delay` seconds after the first update,
+# with the latest value pushed for the key
+class Debouncer(Generic[KeyT, ValueT]):
+    def __init__(self, delay: float, callback: Callable[[KeyT, ValueT], Awaitable[None]]):
+        self.delay = delay
+        self.callback = callback
+        self._latest: dict[KeyT, ValueT] = {}
+        self._tasks: dict[KeyT, asyncio.Task] = {}
+
+    def push(self, key: KeyT, value: ValueT) -> None:
+        self._latest[key] = value
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._fire(key))
+
+    def cancel(self, key: KeyT) -> None:
+        self._latest.pop(key, None)
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    async def _fire(self, key: KeyT) -> None:
+        await asyncio.sleep(self.delay)
+        # updates pushed from now on start a new window
+        self._tasks.pop(key, None)
+        value = self._latest.pop(key)
+        try:
+            await self.callback(key, value)
+        except Exception:
+            logger.exception(f'Debounced update of {key} failed')
+
+
+# Collects bursts of values per key: the callback runs once, `delay` seconds after the first value,
+# with all values added for the key in order. The delay is given per burst, so keys can use different windows
+class Coalescer(Generic[KeyT, ValueT]):
+    def __init__(self, callback: Callable[[KeyT, list[ValueT]], Awaitable[None]]):
+        self.callback = callback
+        self._values: dict[KeyT, list[ValueT]] = {}
+        self._tasks: dict[KeyT, asyncio.Task] = {}
+
+    def add(self, key: KeyT, value: ValueT, delay: float) -> None:
+        self._values.setdefault(key, []).append(value)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._fire(key, delay))
+
+    def pending(self, key: KeyT) -> bool:
+        return key in self._values
+
+    async def flush(self, key: KeyT) -> None:
+        """Runs the callback for the key right away instead of at the end of its window."""
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+        await self._run(key)
+
+    def clear(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks = {}
+        self._values = {}
+
+    async def _fire(self, key: KeyT, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # values added from now on start a new window
+        self._tasks.pop(key, None)
+        await self._run(key)
+
+    async def _run(self, key: KeyT) -> None:
+        values = self._values.pop(key, None)
+        if not values:
+            return
+        try:
+            await self.callback(key, values)
+        except Exception:
+            logger.exception(f'Coalesced burst of {key} failed')
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Sequence
+
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from bot import db
+from bot.db.write_buffer import DUPLICATE_KEY_ERROR
+from bot.metrics import count_writes
+from bot.util import get_uuid
+
+logger = logging.getLogger(__name__)
+
+
+def insert_new(collection: Collection, docs: list[dict]) -> list[int]:
+    """Inserts the docs unordered, returns the indexes of docs that already existed."""
+    try:
+        collection.insert_many(docs, ordered=False)
+        return []
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        return [error['index'] for error in errors]
+
+
+def claim_batch(collection: Collection, channel_ids: list[int], token: str, lease: timedelta, limit: int) -> list[dict]:
+    now = datetime.utcnow()
+    claimable = {
+        'status': db.DeliveryStatus.PENDING.value,
+        'channel_id': {'$in': channel_ids},
+        'lease_until': {'$lte': now},
+    }
+    ids = [doc['_id'] for doc in collection.find(claimable, {'_id': 1}).sort('created', ASCENDING).limit(limit)]
+    if not ids:
+        return []
+    # entries claimed by another process in between keep its lease
+    collection.update_many(
+        {'_id': {'$in': ids}, **claimable},
+        {'$set': {'lease_token': token, 'lease_until': now + lease, 'updated': now}}
+    )
+    return list(collection.find({'_id': {'$in': ids}, 'lease_token': token}))
+
+
+def release_leases(collection: Collection, token: str) -> int:
+    now = datetime.utcnow()
+    res = collection.update_many(
+        {'lease_token': token, 'status': db.DeliveryStatus.PENDING.value},
+        {'$set': {'lease_token': None, 'lease_until': now, 'updated': now}}
+    )
+    return res.modified_count
+
+
+def renew_leases(collection: Collection, token: str, ids: list[str], lease: timedelta) -> None:
+    now = datetime.utcnow()
+    collection.update_many(
+        {'id': {'$in': ids}, 'lease_token': token, 'status': db.DeliveryStatus.PENDING.value},
+        {'$set': {'lease_until': now + lease, 'updated': now}}
+    )
+
+
+def mark_send_started(collection: Collection, ids: list[str], started: datetime) -> None:
+    collection.update_many({'id': {'$in': ids}}, {'$set': {'send_started': started, 'updated': started}})
+
+
+def mark_sent(collection: Collection, ids: list[str]) -> None:
+    collection.update_many(
+        {'id': {'$in': ids}},
+        {'$set': {'status': db.DeliveryStatus.SENT.value, 'lease_token': None, 'updated': datetime.utcnow()}}
+    )
+
+
+# Durable outbox of copies, one entry per (source message, target channel). Entries are written before sending
+# and claimed with a lease, so copies in flight during a restart or crash are sent by whoever claims them next.
+# Sent entries stay as idempotency keys until the retention removes them. Leases of entries waiting in this
+# process are renewed, so a lease only runs out when its process is gone.
+class Outbox:
+    def __init__(self, batch_size: int, lease_seconds: float, max_attempts: int, ack_flush_seconds: float):
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.ack_flush_seconds = ack_flush_seconds
+        # leases of this process
+        self.token = get_uuid()
+        self._acks: list[str] = []
+        self._ack_task: asyncio.Task | None = None
+        self._writes: list[tuple[list[dict], asyncio.Future[set[int]]]] = []
+        self._commit_task: asyncio.Task | None = None
+        # claimed entries not acked or failed yet, never handed out twice
+        self._in_flight: set[str] = set()
+        self._renewed_at = time.monotonic()
+
+    async def enqueue(self, deliveries: list[db.Delivery], claim: set[int]) -> list[db.Delivery]:
+        """Writes new entries, leased right away for the given channels. Returns the new entries claimed."""
+        if not deliveries:
+            return []
+        lease_until = datetime.utcnow() + self.lease
+        for delivery in deliveries:
+            if delivery.channel_id in claim:
+                delivery.lease_token = self.token
+                delivery.lease_until = lease_until
+
+        codec = db.deliveries.sync.codec
+        future = asyncio.get_running_loop().create_future()
+        self._writes.append(([codec.encode(delivery) for delivery in deliveries], future))
+        if self._commit_task is None:
+            self._commit_task = asyncio.create_task(self._commit())
+        existing = await future
+        if existing:
+            # replayed message, its copies are queued or sent already
+            logger.info(f'Skipped {len(existing)} deliveries already in the outbox')
+        claimed = [
+            delivery for i, delivery in enumerate(deliveries)
+            if i not in existing and delivery.lease_token == self.token
+        ]
+        self._in_flight.update(delivery.id for delivery in claimed)
+        return claimed
+
+    async def _commit(self) -> None:
+        # group commit: entries of all messages that arrive while an insert is running go in the next one
+        try:
+            while self._writes:
+                writes, self._writes = self._writes, []
+                docs = [doc for write_docs, _ in writes for doc in write_docs]
+                try:
+                    existing = await db.deliveries.run(insert_new, db.deliveries.sync.collection, docs)
+                except Exception as e:
+                    count_writes(db.deliveries.name, (doc['bridge_name'] for doc in docs), 'failed')
+                    for _, future in writes:
+                        future.set_exception(e)
+                    continue
+                duplicates = set(existing)
+                written = (doc['bridge_name'] for i, doc in enumerate(docs) if i not in duplicates)
+                count_writes(db.deliveries.name, written, 'written')
+                count_writes(db.deliveries.name, (docs[i]['bridge_name'] for i in duplicates), 'duplicate')
+                offset = 0
+                for write_docs, future in writes:
+                    future.set_result({i - offset for i in existing if offset <= i < offset + len(write_docs)})
+                    offset += len(write_docs)
+        finally:
+            self._commit_task = None
+
+    async def claim(self, channel_ids: list[int]) -> list[db.Delivery]:
+        if not channel_ids:
+            return []
+        docs = await db.deliveries.run(
+            claim_batch, db.deliveries.sync.collection, channel_ids, self.token, self.lease, self.batch_size
+        )
+        # still waiting in a send queue of this process, the claim only renewed its lease
+        deliveries = [db.deliveries.from_dict(doc) for doc in docs if doc['id'] not in self._in_flight]
+        self._in_flight.update(delivery.id for delivery in deliveries)
+        return deliveries
+
+    def release(self, delivery: db.Delivery) -> None:
+        """Gives up an entry without sending it, whoever claims it after its lease sends it."""
+        self._in_flight.discard(delivery.id)
+
+    async def renew_leases(self) -> None:
+        self._renewed_at = time.monotonic()
+        if not self._in_flight:
+            return
+        await db.deliveries.run(
+            renew_leases, db.deliveries.sync.collection, self.token, list(self._in_flight), self.lease
+        )
+
+    async def mark_send_started(self, deliveries: Sequence[db.Delivery]) -> None:
+        started = datetime.utcnow()
+        for delivery in deliveries:
+            delivery.send_started = started
+        await db.deliveries.run(
+            mark_send_started, db.deliveries.sync.collection, [delivery.id for delivery in deliveries], started
+        )
+
+    def ack(self, delivery: db.Delivery) -> None:
+        self._in_flight.discard(delivery.id)
+        # acks are batched, after a crash before the flush the copy is sent again with its enforced nonce,
+        # or found by its send_started mark when it went through a webhook
+        self._acks.append(delivery.id)
+        if self._ack_task is None:
+            self._ack_task = asyncio.create_task(self._flush_acks_later())
+
+    async def fail(self, delivery: db.Delivery) -> None:
+        self._in_flight.discard(delivery.id)
+        attempts = delivery.attempts + 1
+        if attempts >= self.max_attempts:
+            await db.deliveries.set_fields(delivery.id, attempts=attempts, status=db.DeliveryStatus.FAILED)
+            logger.error(f'Delivery {delivery.id} failed {attempts} times, giving up')
+            return
+        # released with backoff, any process may retry it then
+        retry_at = datetime.utcnow() + timedelta(seconds=2 ** attempts)
+        await db.deliveries.set_fields(delivery.id, attempts=attempts, lease_token=None, lease_until=retry_at)
+
+    async def _flush_acks_later(self) -> None:
+        await asyncio.sleep(self.ack_flush_seconds)
+        self._ack_task = None
+        await self.flush_acks()
+
+    async def flush_acks(self) -> None:
+        ids, self._acks = self._acks, []
+        if not ids:
+            return
+        try:
+            await db.deliveries.run(mark_sent, db.deliveries.sync.collection, ids)
+        except PyMongoError as e:
+            logger.error(f'Failed to ack {len(ids)} deliveries, will retry: {e}')
+            self._acks = ids + self._acks
+
+    async def drain(
+            self,
+            channel_ids: list[int],
+            deliver: Callable[[list[db.Delivery]], Awaitable[None]]
+    ) -> int:
+        count = 0
+        while deliveries := await self.claim(channel_ids):
+            await deliver(deliveries)
+            count += len(deliveries)
+        return count
+
+    async def run(
+            self,
+            owned_channel_ids: Callable[[], list[int]],
+            deliver: Callable[[list[db.Delivery]], Awaitable[None]],
+            interval: float
+    ) -> None:
+        while True:
+            try:
+                # renewed well before they run out, sends may wait in a rate-limited queue for longer than a lease
+                if time.monotonic() - self._renewed_at > self.lease.total_seconds() / 3:
+                    await self.renew_leases()
+                count = await self.drain(owned_channel_ids(), deliver)
+                if count:
+                    logger.debug('Delivered %s outbox entries', count)
+            except Exception:
+                logger.exception('Failed to process outbox entries')
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        if self._ack_task is not None:
+            self._ack_task.cancel()
+            self._ack_task = None
+        await self.flush_acks()
+        # unsent entries are replayed by the next process right away instead of after the lease
+        released = await db.deliveries.run(release_leases, db.deliveries.sync.collection, self.token)
+        self._in_flight.clear()
+        if released:
+            logger.info(f'Released {released} unsent outbox entries')
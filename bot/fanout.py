@@ -0,0 +1,32 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+TargetT = TypeVar('TargetT')
+
+
+async def fan_out(
+        targets: Iterable[TargetT],
+        send: Callable[[TargetT], Awaitable[None]],
+        max_concurrency: int
+) -> list[TargetT]:
+    """
+    Runs `send` for all targets concurrently, at most `max_concurrency` at a time.
+    A failing target never affects the others, returns the targets that failed.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def send_one(target: TargetT) -> bool:
+        async with semaphore:
+            try:
+                await send(target)
+                return True
+            except Exception:
+                logger.exception(f'Fan-out delivery to {target} failed')
+                return False
+
+    targets = list(targets)
+    results = await asyncio.gather(*[send_one(target) for target in targets])
+    return [target for target, ok in zip(targets, results) if not ok]
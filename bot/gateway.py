@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+import aiohttp
+import discord
+
+from bot.cache import LruCache
+from env import settings, RuntimeProfile
+
+logger = logging.getLogger(__name__)
+
+KeyT = TypeVar('KeyT', bound=Hashable)
+ValueT = TypeVar('ValueT')
+
+# remembered misses, so a deleted channel or a member who left costs one request per TTL
+MISSING = object()
+
+
+def gateway_options(profile: RuntimeProfile) -> dict[str, Any]:
+    """Intents and cache options of the bot client for the runtime profile."""
+    if profile == RuntimeProfile.LEAN:
+        # guilds keeps channels and roles cached, messages come from guild channels and DMs for commands
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.guild_messages = True
+        intents.dm_messages = True
+        intents.message_content = True
+        return {
+            'intents': intents,
+            'max_messages': settings.lean_max_messages,
+            'member_cache_flags': discord.MemberCacheFlags.none(),
+            'chunk_guilds_at_startup': False,
+        }
+
+    intents = discord.Intents.default()
+    intents.message_content = True
+    return {'intents': intents, 'max_messages': settings.max_messages}
+
+
+# Discord objects by key: discord.py's cache first, then objects fetched over REST on a miss and kept for a while,
+# for profiles that keep little in discord.py's own caches. Without `fetch` it only reads discord.py's cache
+class FetchCache(Generic[KeyT, ValueT]):
+    def __init__(
+            self,
+            get: Callable[[KeyT], ValueT | None],
+            fetch: Callable[[KeyT], Awaitable[ValueT]] | None,
+            max_size: int,
+            ttl: float
+    ):
+        self._get = get
+        self._fetch = fetch
+        self.fetched: LruCache[KeyT, Any] = LruCache(max_size, ttl)
+
+    async def get(self, key: KeyT) -> ValueT | None:
+        value = self._get(key)
+        if value is not None or self._fetch is None:
+            return value
+        value = self.fetched.get(key)
+        if value is not None:
+            return None if value is MISSING else value
+
+        try:
+            value = await self._fetch(key)
+        except (discord.NotFound, discord.Forbidden) as e:
+            logger.debug(f'Fetching {key} failed: {e}')
+            value = None
+        except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # a miss for this lookup only, not remembered, the next one fetches again
+            logger.warning(f'Fetching {key} failed: {e!r}')
+            return None
+        self.fetched.put(key, MISSING if value is None else value)
+        return value
@@ -0,0 +1,96 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from bot.metrics import LOG_RECORDS_DROPPED
+from env import LogFormat
+
+LOG_FORMAT = '[%(asctime)s][%(levelname)s][%(name)s] %(message)s'
+LOG_DATE_FORMAT = '%I:%M:%S'
+
+listener: QueueListener | None = None
+
+
+# Bounded queue that makes room by dropping the oldest record, so a slow stdout never blocks the event loop
+class DropOldestQueue(queue.Queue):
+    def put_nowait(self, item) -> None:
+        while True:
+            try:
+                super().put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.get_nowait()
+                    LOG_RECORDS_DROPPED.inc()
+                except queue.Empty:
+                    pass
+
+
+# Keeps every record from INFO up and one in `every` debug records of each call site
+class DebugSampler(logging.Filter):
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self.seen: Counter[tuple[str, int]] = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        site = (record.pathname, record.lineno)
+        self.seen[site] += 1
+        return self.seen[site] % self.every == 1
+
+
+# Hands records to the writer thread with only the message merged, timestamps and tracebacks are formatted there
+class LazyQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            doc['exception'] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False)
+
+
+def setup_logging(level: str, log_format: LogFormat, queue_size: int, debug_sample_every: int) -> None:
+    global listener
+
+    handler = logging.StreamHandler(sys.stdout)
+    if log_format == LogFormat.JSON:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    records = DropOldestQueue(queue_size)
+    queue_handler = LazyQueueHandler(records)
+    queue_handler.addFilter(DebugSampler(debug_sample_every))
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+
+    listener = QueueListener(records, handler)
+    listener.start()
+    # the records of a crash are written before the process exits
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Writes the queued records and stops the writer thread."""
+    global listener
+
+    if listener is not None:
+        listener.stop()
+        listener = None
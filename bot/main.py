@@ -1,20 +1,42 @@
+import asyncio
+import dataclasses
 import enum
+import hashlib
 import logging
+import signal
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
 
+import aiohttp
 import discord
 from discord.ext import commands
 from discord.ui import Button, View
+from pymongo.errors import DuplicateKeyError, ExecutionTimeout
 
 from bot import db
-from env import settings
-
-LOG_FORMAT = '[%(asctime)s][%(levelname)s][%(name)s] %(message)s'
-LOG_DATE_FORMAT = '%I:%M:%S'
-logging.basicConfig(
-    format=LOG_FORMAT,
-    datefmt=LOG_DATE_FORMAT,
-    level=settings.log_level
+from bot.attachments import AttachmentSpool, AttachmentTooLarge
+from bot.backfill import Backfiller
+from bot.cache import LruCache
+from bot.db.archive import new_archivers, archive_periodically
+from bot.db.diagnostics import check_query_plans
+from bot.debounce import Coalescer, Debouncer
+from bot.delivery import Outbox
+from bot.fanout import fan_out
+from bot.gateway import FetchCache, gateway_options
+from bot.logs import setup_logging, stop_logging
+from bot.metrics import (
+    MESSAGES, SENDS, SEND_QUEUE_DEPTH, CACHE_HITS, CACHE_MISSES, measure, start_metrics_server, monitor_event_loop
 )
+from bot.render import build_embed, embed_cache, parts_cache
+from bot.replies import reply_index
+from bot.routing import FanOutPlan, routing_index
+from bot.scheduler import rate_limits, send_scheduler
+from bot.search import find_text, parse_query, search_filters
+from bot.webhooks import WebhookPool
+from env import settings, DeliveryMode
+
+# records are written to stdout from a separate thread, so a stalled log driver can't stall forwarding
+setup_logging(settings.log_level, settings.log_format, settings.log_queue_size, settings.log_debug_sample_every)
 logging.getLogger('discord').setLevel(settings.log_level)
 logging.getLogger('discord.client').setLevel(logging.INFO)
 logging.getLogger('discord.http').setLevel(logging.INFO)
@@ -22,10 +44,131 @@ logging.getLogger('discord.gateway').setLevel(logging.INFO)
 
 logger = logging.getLogger(__name__)
 
-intents = discord.Intents.default()
-intents.message_content = True
 COMMAND_PREFIX = '/'
-bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents)
+# Discord limits of a message, merged bursts are split to fit
+MESSAGE_CONTENT_LIMIT = 2000
+EMBED_DESCRIPTION_LIMIT = 4096
+# this process runs only some of the shards, copies to other channels are sent by other processes
+MULTI_PROCESS = settings.sharded and settings.shard_ids is not None
+
+
+class BridgeBot(commands.AutoShardedBot if settings.sharded else commands.Bot):
+    archive_task: asyncio.Task | None = None
+    event_loop_task: asyncio.Task | None = None
+    reply_index_task: asyncio.Task | None = None
+    delivery_task: asyncio.Task | None = None
+    replay_task: asyncio.Task | None = None
+    routing_refresh_task: asyncio.Task | None = None
+
+    async def setup_hook(self) -> None:
+        for collection in db.collections:
+            try:
+                await collection.ensure_indexes()
+            except Exception:
+                logger.exception(f'Failed to ensure indexes of {collection.name}')
+        if settings.db_check_query_plans:
+            await check_query_plans()
+
+        if settings.metrics_port is not None:
+            start_metrics_server(settings.metrics_port)
+        self.event_loop_task = asyncio.create_task(
+            monitor_event_loop(settings.event_loop_lag_interval_seconds, update_metrics)
+        )
+
+        for buffer in db.write_buffers:
+            buffer.start()
+        await webhook_pool.load()
+        attachment_spool.load()
+        # retries, and copies of other processes' messages
+        self.delivery_task = asyncio.create_task(
+            outbox.run(owned_channel_ids, deliver_claimed, settings.delivery_poll_seconds)
+        )
+        if MULTI_PROCESS:
+            # copies are mapped by other processes too, so the filter would hide their replies
+            if not settings.routing_change_streams:
+                self.routing_refresh_task = asyncio.create_task(
+                    routing_index.refresh_periodically(settings.routing_refresh_seconds)
+                )
+        else:
+            # replies are looked up in the db until the filter is loaded
+            self.reply_index_task = asyncio.create_task(reply_index.load())
+        if settings.archive_expired_messages:
+            self.archive_task = asyncio.create_task(
+                archive_periodically(new_archivers(), settings.archive_interval_minutes * 60)
+            )
+        try:
+            # docker stop sends SIGTERM, close gracefully to flush buffered writes
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass
+
+    async def close(self) -> None:
+        # flushed before discord.py's close, bot.run() cancels whatever is still running once that returns
+        await send_scheduler.close()
+        # unsent bursts stay in the outbox and are replayed
+        burst_coalescer.clear()
+        await outbox.close()
+        await attachment_spool.close()
+        for buffer in db.write_buffers:
+            await buffer.close()
+        await super().close()
+
+
+shard_options = {'shard_count': settings.shard_count, 'shard_ids': settings.shard_ids} if settings.sharded else {}
+bot = BridgeBot(
+    command_prefix=COMMAND_PREFIX,
+    http_trace=rate_limits.trace_config(),
+    **gateway_options(settings.runtime_profile),
+    **shard_options
+)
+webhook_pool = WebhookPool(bot, rate_limits)
+outbox = Outbox(
+    settings.delivery_batch_size,
+    settings.delivery_lease_seconds,
+    settings.delivery_max_attempts,
+    settings.delivery_ack_flush_seconds
+)
+attachment_spool = AttachmentSpool(
+    settings.attachment_spool_dir,
+    int(settings.attachment_spool_max_mb * 1024 * 1024),
+    int(settings.attachment_max_mb * 1024 * 1024)
+)
+
+
+def cached_member(key: tuple[int, int]) -> discord.Member | None:
+    guild = bot.get_guild(key[0])
+    return guild.get_member(key[1]) if guild is not None else None
+
+
+async def fetch_member(key: tuple[int, int]) -> discord.Member | None:
+    guild = bot.get_guild(key[0])
+    return await guild.fetch_member(key[1]) if guild is not None else None
+
+
+# in multi-process mode a channel missing from the gateway cache belongs to another process, it's never fetched
+channel_cache = FetchCache[int, discord.abc.GuildChannel](
+    lambda channel_id: bot.get_channel(channel_id),
+    None if MULTI_PROCESS else bot.fetch_channel,
+    settings.fetch_cache_size,
+    settings.fetch_cache_ttl_seconds
+)
+member_cache = FetchCache[tuple[int, int], discord.Member](
+    cached_member, fetch_member, settings.fetch_cache_size, settings.fetch_cache_ttl_seconds
+)
+
+
+def update_metrics() -> None:
+    depths: dict[str, int] = {}
+    for stats in send_scheduler.stats():
+        plan = routing_index.plan(stats.channel_id)
+        for bridge_name in plan.bridge_names if plan is not None else ('',):
+            depths[bridge_name] = depths.get(bridge_name, 0) + stats.depth
+    for bridge_name, depth in depths.items():
+        SEND_QUEUE_DEPTH.labels(bridge_name).set(depth)
+    for name, cache in (('users', user_cache), ('replies', reply_index.cache)):
+        CACHE_HITS.labels(name).set(cache.hits)
+        CACHE_MISSES.labels(name).set(cache.misses)
+    CACHE_HITS.labels('reply_filter').set(reply_index.filtered)
 
 
 async def check_user_manager(ctx: commands.Context) -> None:
@@ -40,27 +183,55 @@ async def check_user_manager_interaction(interaction: discord.Interaction) -> No
         raise commands.CommandError(f'User {interaction.user.name} is not a manager.')
 
 
-def get_user_or_create(discord_user: discord.User) -> db.User:
-    user = db.users.get_by_primary_key(discord_user.id, throw_ex=False)
+user_cache: LruCache[int, db.User] = LruCache(settings.user_cache_size, settings.user_cache_ttl_seconds)
+
+
+async def get_user_or_create(discord_user: discord.User) -> db.User:
+    user = user_cache.get(discord_user.id)
+    if user is None:
+        user = await db.users.get_by_primary_key(discord_user.id, throw_ex=False)
+
     if user is None:
         user = db.User(
             id=discord_user.id,
             name=discord_user.name,
-            display_name=discord_user.display_name,
+            display_name=discord_user.global_name or discord_user.name,
             colour=db.Colour.from_discord(discord_user.colour)
         )
-        db.users.create(user)
-        logger.info(f'Created user {user}')
+        try:
+            await db.users.create(user)
+            logger.info(f'Created user {user}')
+        except DuplicateKeyError:
+            # created concurrently while handling another message of the user
+            user = await db.users.get_by_primary_key(discord_user.id)
+    else:
+        await refresh_user(user, discord_user)
+
+    user_cache.put(discord_user.id, user)
     return user
 
 
+async def refresh_user(user: db.User, discord_user: discord.User) -> None:
+    # account-wide fields only, nicknames and role colours differ between servers
+    name = discord_user.name
+    display_name = discord_user.global_name or discord_user.name
+    if user.name == name and user.display_name == display_name:
+        return
+
+    user.name = name
+    user.display_name = display_name
+    parts_cache.invalidate_user(user.id)
+    await db.users.update(user)
+    logger.info(f'Updated user {user}')
+
+
 # BRIDGE MANAGEMENT
 
 @bot.command()
 async def my_bridges(ctx: commands.Context):
     await check_user_manager(ctx)
 
-    bridges = db.bridges.get_many(creator_id=ctx.author.id)
+    bridges = await db.bridges.get_many(creator_id=ctx.author.id)
     text = f'🤝 You created **{len(bridges)} bridges.**\n' \
            f'\n'
 
@@ -79,16 +250,17 @@ async def my_bridges(ctx: commands.Context):
 async def create_bridge(ctx: commands.Context, bridge_name: str):
     await check_user_manager(ctx)
 
-    creator = get_user_or_create(ctx.author)
-    bridge = db.bridges.get_one(name=bridge_name)
+    creator = await get_user_or_create(ctx.author)
+    bridge = await db.bridges.get_one(name=bridge_name)
     if bridge is not None:
         await ctx.send(f'Sorry, bridge **{bridge_name}** already exists. Please try different name.')
         return
 
-    bridge = db.bridges.create(db.Bridge(
+    bridge = await db.bridges.create(db.Bridge(
         name=bridge_name,
         creator_id=creator.id
     ))
+    routing_index.set_bridge(bridge.name, bridge.channel_ids)
     logger.info(f'Created bridge {bridge}')
 
     text = f'✅ Congratulations! New bridge **{bridge.name}**.'
@@ -96,16 +268,39 @@ async def create_bridge(ctx: commands.Context, bridge_name: str):
     await ctx.send(text, view=view)
 
 
+@bot.command()
+async def coalesce_bridge(ctx: commands.Context, bridge_name: str, seconds: float):
+    await check_user_manager(ctx)
+
+    bridge = await db.bridges.get_one(name=bridge_name)
+    if bridge is None:
+        await ctx.send(f'So sorry, but... Bridge {bridge_name} not found.')
+        return
+    if bridge.creator_id != ctx.author.id:
+        await ctx.send(f'Sorry, only bridge creator can change coalescing.')
+        return
+
+    coalesce_seconds = seconds if seconds > 0 else None
+    await db.bridges.set_fields(bridge.name, coalesce_seconds=coalesce_seconds)
+    routing_index.set_coalescing(bridge.name, coalesce_seconds)
+    logger.info(f'Set coalescing of bridge {bridge.name} to {coalesce_seconds}')
+
+    if coalesce_seconds is None:
+        await ctx.send(f'✅ Bridge **{bridge.name}** forwards every message on its own.')
+    else:
+        await ctx.send(f'✅ Bridge **{bridge.name}** merges messages sent within {coalesce_seconds:g}s.')
+
+
 @bot.command()
 async def manage_bridge(ctx: commands.Context, bridge_name: str):
     await check_user_manager(ctx)
 
-    bridge = db.bridges.get_one(name=bridge_name)
+    bridge = await db.bridges.get_one(name=bridge_name)
     if bridge is None:
         await ctx.send(f'So sorry, but... Bridge {bridge_name} not found.')
         return
 
-    bridge_channels = db.bridge_channels.get_many(bridge_name=bridge.name)
+    bridge_channels = await db.bridge_channels.get_many(bridge_name=bridge.name)
     channels_str = '\n'.join([
         f'{i + 1}. **#{bridge_channel.name}** from **{bridge_channel.server_name}**'
         for i, bridge_channel in enumerate(bridge_channels)
@@ -167,7 +362,7 @@ class AddChannelButton(Button):
     async def callback(self, interaction: discord.Interaction):
         await check_user_manager_interaction(interaction)
 
-        bridge_channel = db.bridge_channels.get_one(id=self.channel.id, bridge_name=self.bridge.name)
+        bridge_channel = await db.bridge_channels.get_one(id=self.channel.id, bridge_name=self.bridge.name)
         if bridge_channel is not None:
             await interaction.response.send_message(
                 f'Oops, channel **{self.channel.name}** already in the bridge **{self.bridge.name}**.'
@@ -181,15 +376,29 @@ class AddChannelButton(Button):
             creator_id=self.creator_id,
             server_name=self.server_name
         )
-        db.bridge_channels.create(bridge_channel)
+        try:
+            await db.bridge_channels.create(bridge_channel)
+        except DuplicateKeyError:
+            # added by a concurrent click
+            await interaction.response.send_message(
+                f'Oops, channel **{self.channel.name}** already in the bridge **{self.bridge.name}**.'
+            )
+            return
         logger.info(f'Created bridge channel: {bridge_channel}')
 
-        self.bridge.channel_ids.append(self.channel.id)
-        db.bridges.update(self.bridge)
-        logger.info(f'Updated bridge: {self.bridge}')
+        # atomic, concurrent edits of the same bridge don't overwrite each other
+        bridge = await db.bridges.add_to_set(self.bridge.name, 'channel_ids', self.channel.id)
+        if bridge is None:
+            await interaction.response.send_message(f'Oof, sorry. Bridge {self.bridge.name} not found.')
+            return
+        self.bridge = bridge
+        routing_index.set_bridge(bridge.name, bridge.channel_ids)
+        logger.info(f'Updated bridge: {bridge}')
 
         text = f'✅ Added channel **{self.channel.name}** to bridge **{self.bridge.name}**.'
         await interaction.response.send_message(text)
+        if settings.backfill_limit > 0:
+            await backfiller.start(bridge.name, self.channel.id, interaction.channel)
 
 
 class AddChannelSelector(View):
@@ -208,7 +417,7 @@ async def add_channel_to_bridge(ctx: commands.Context, bridge_name: str):
 
 
 async def add_channel_to_bridge_internal(bridge_name: str, guild: discord.Guild, creator_id: int, send_func: callable):
-    bridge = db.bridges.get_one(name=bridge_name)
+    bridge = await db.bridges.get_one(name=bridge_name)
     if bridge is None:
         await send_func(f'Oof, sorry. Bridge {bridge_name} not found.')
         return
@@ -234,11 +443,15 @@ class RemoveChannelButton(Button):
     async def callback(self, interaction: discord.Interaction):
         await check_user_manager_interaction(interaction)
 
-        db.bridge_channels.remove_by(id=self.bridge_channel.id, bridge_name=self.bridge.name)
+        await db.bridge_channels.remove_by(id=self.bridge_channel.id, bridge_name=self.bridge.name)
 
-        self.bridge.channel_ids.remove(self.bridge_channel.id)
-        db.bridges.update(self.bridge)
-        logger.info(f'Updated bridge: {self.bridge}')
+        bridge = await db.bridges.pull(self.bridge.name, 'channel_ids', self.bridge_channel.id)
+        if bridge is None:
+            await interaction.response.send_message(f'Oof, sorry. Bridge {self.bridge.name} not found.')
+            return
+        self.bridge = bridge
+        routing_index.set_bridge(bridge.name, bridge.channel_ids)
+        logger.info(f'Updated bridge: {bridge}')
 
         text = f'✅ Removed channel **{self.label}** from the bridge **{self.bridge.name}**.'
         await interaction.response.send_message(text)
@@ -260,7 +473,7 @@ async def remove_channel_from_bridge(ctx: commands.Context, bridge_name: str):
 
 
 async def remove_channel_from_bridge_internal(bridge_name: str, creator_id: int, send_func: callable):
-    bridge = db.bridges.get_one(name=bridge_name)
+    bridge = await db.bridges.get_one(name=bridge_name)
     if bridge is None:
         await send_func(f'Oof, sorry. Bridge {bridge_name} not found.')
         return
@@ -268,7 +481,7 @@ async def remove_channel_from_bridge_internal(bridge_name: str, creator_id: int,
         await send_func(f'Sorry, only bridge creator can remove channels.')
         return
 
-    bridge_channels = db.bridge_channels.get_many(bridge_name=bridge.name)
+    bridge_channels = await db.bridge_channels.get_many(bridge_name=bridge.name)
     if len(bridge_channels) == 0:
         await send_func(f'Oops, bridge **{bridge.name}** has no channels.')
         return
@@ -282,16 +495,130 @@ async def remove_channel_from_bridge_internal(bridge_name: str, creator_id: int,
         i += 25
 
 
+# BRIDGE SEARCH
+
+SEARCH_PAGE_SIZE = 10
+
+
+@bot.command()
+async def search_bridge(ctx: commands.Context, bridge_name: str, *, query: str):
+    channel_ids = routing_index.bridge_channel_ids(bridge_name)
+    if not channel_ids:
+        await ctx.send(f'So sorry, but... Bridge {bridge_name} not found or has no channels.')
+        return
+    if ctx.channel.id not in channel_ids:
+        await ctx.send(f'Sorry, bridge **{bridge_name}** can only be searched from its channels.')
+        return
+
+    try:
+        query, days = parse_query(query, settings.search_default_days)
+    except ValueError:
+        await ctx.send('Sorry, `days:` takes a number, like `days:7`.')
+        return
+    if not query:
+        await ctx.send('Sorry, nothing to search for besides `days:`.')
+        return
+
+    since = datetime.utcnow() - timedelta(days=days)
+    # bridges sorted before this one may hold messages of channels they share with it
+    primary_names = sorted({
+        name for channel_id in channel_ids for name in routing_index.plan(channel_id).bridge_names
+        if name <= bridge_name
+    })
+    filters = search_filters(bridge_name, primary_names, query, since)
+    try:
+        with measure('search', bridge_name):
+            docs = await db.bridge_messages.run(
+                find_text,
+                db.bridge_messages.sync.collection,
+                filters,
+                settings.search_max_results,
+                settings.search_max_time_ms
+            )
+    except ExecutionTimeout:
+        await ctx.send(f'⌛ Search took too long, please try a smaller `days:N` or more specific words.')
+        return
+
+    messages = [db.bridge_messages.from_dict(doc) for doc in docs]
+    if not messages:
+        await ctx.send(f'🔍 Nothing found in bridge **{bridge_name}** for *{discord.utils.escape_markdown(query)}*.')
+        return
+    view = SearchResultsView(bridge_name, query, messages)
+    await ctx.send(embed=view.page_embed(), view=view)
+
+
+def search_result_line(message: db.BridgeMessage) -> str:
+    text = message.text.replace('\n', ' ')
+    if len(text) > 100:
+        text = text[:99] + '…'
+    created = int(message.created.replace(tzinfo=timezone.utc).timestamp())
+    line = f'<t:{created}:R> <@{message.author_id}>: {discord.utils.escape_markdown(text)}'
+
+    guild_id = message.guild_id
+    if guild_id is None:
+        channel = bot.get_channel(message.channel_id)
+        guild_id = channel.guild.id if channel is not None else None
+    if guild_id is not None:
+        line += f' [jump](https://discord.com/channels/{guild_id}/{message.channel_id}/{message.id})'
+    return line
+
+
+class SearchPageButton(Button):
+    def __init__(self, label: str, step: int):
+        super().__init__(label=label, style=discord.ButtonStyle.secondary)
+        self.step = step
+
+    async def callback(self, interaction: discord.Interaction):
+        view: SearchResultsView = self.view
+        view.turn(self.step)
+        await interaction.response.edit_message(embed=view.page_embed(), view=view)
+
+
+class SearchResultsView(View):
+    def __init__(self, bridge_name: str, query: str, messages: list[db.BridgeMessage]):
+        super().__init__(timeout=600)
+        self.bridge_name = bridge_name
+        self.query = query
+        self.messages = messages
+        self.page = 0
+        self.pages = (len(messages) + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+        self.previous_button = SearchPageButton('◀', -1)
+        self.next_button = SearchPageButton('▶', 1)
+        if self.pages > 1:
+            self.add_item(self.previous_button)
+            self.add_item(self.next_button)
+        self.turn(0)
+
+    def turn(self, step: int) -> None:
+        self.page = min(max(self.page + step, 0), self.pages - 1)
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page == self.pages - 1
+
+    def page_embed(self) -> discord.Embed:
+        start = self.page * SEARCH_PAGE_SIZE
+        lines = [search_result_line(message) for message in self.messages[start:start + SEARCH_PAGE_SIZE]]
+        embed = discord.Embed(title=f'🔍 {self.query}'[:256], description='\n'.join(lines))
+        embed.set_footer(
+            text=f'Bridge {self.bridge_name} • page {self.page + 1}/{self.pages} • {len(self.messages)} matches'
+        )
+        return embed
+
+
 # EVENT HANDLERS
 
 @bot.event
 async def on_ready():
     logger.info(f'Logged in as {bot.user}')
+    await routing_index.load()
+    if settings.routing_change_streams:
+        routing_index.watch()
+    if bot.replay_task is None or bot.replay_task.done():
+        bot.replay_task = asyncio.create_task(replay())
 
 
 @bot.event
 async def on_guild_join(discord_guild: discord.Guild):
-    server = db.servers.get_or_create_with(
+    server = await db.servers.get_or_create_with(
         id=discord_guild.id,
         name=discord_guild.name
     )
@@ -300,73 +627,499 @@ async def on_guild_join(discord_guild: discord.Guild):
 
 @bot.event
 async def on_message(message: discord.Message):
-    if message.author == bot.user:
-        return
+    if await handle_message(message):
+        await bot.process_commands(message)
 
-    user = get_user_or_create(message.author)
-    logger.debug(f'User {user.name} sent message:\n{message}')
 
-    if not message_is_command(message):
-        reply_handled = await handle_reply_message(message)
-        if not reply_handled:
-            await handle_bridge_message(message)
+def is_own_message(message: discord.Message) -> bool:
+    # sent by the bot or one of our forwarded copies
+    return message.author == bot.user or (message.webhook_id is not None and webhook_pool.is_own(message.webhook_id))
 
-    await bot.process_commands(message)
+
+async def handle_message(message: discord.Message) -> bool:
+    if is_own_message(message):
+        return False
+
+    with measure('user'):
+        user = await get_user_or_create(message.author)
+    if logger.isEnabledFor(logging.DEBUG):
+        # the message repr is long, only built when it's logged
+        logger.debug(f'User {user.name} sent message:\n{message}')
+
+    if message_is_command(message):
+        MESSAGES.labels('command').inc()
+    elif await handle_reply_message(message):
+        MESSAGES.labels('reply').inc()
+    elif await handle_bridge_message(message):
+        MESSAGES.labels('bridged').inc()
+    else:
+        MESSAGES.labels('other').inc()
+    return True
+
+
+@bot.event
+async def on_user_update(before: discord.User, after: discord.User):
+    parts_cache.invalidate_user(after.id)
+
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    parts_cache.invalidate_member(after.id, after.guild.id)
+
+
+@bot.event
+async def on_guild_update(before: discord.Guild, after: discord.Guild):
+    parts_cache.invalidate_guild(after.id)
+
+
+@bot.event
+async def on_raw_message_edit(event: discord.RawMessageUpdateEvent):
+    message = event.message
+    if routing_index.plan(event.channel_id) is None or is_own_message(message):
+        return
+    # Discord sends the whole message on embed unfurls too, only an edit moves its edited timestamp
+    edited_at = message.edited_at
+    if edited_at is None or edit_stamps.get(message.id) == edited_at:
+        return
+    if event.cached_message is not None and event.cached_message.edited_at == edited_at:
+        return
+    edit_stamps.put(message.id, edited_at)
+    edit_debouncer.push(message.id, message)
+
+
+@bot.event
+async def on_raw_message_delete(event: discord.RawMessageDeleteEvent):
+    if routing_index.plan(event.channel_id) is not None:
+        await propagate_delete(event.message_id)
 
 
 # IMPLEMENTATIONS (move to separate files)
 
-def get_user_color(user: discord.User) -> discord.Colour:
-    if not user.colour:
-        return discord.Colour.green()
-    return user.colour
+async def message_author(message: discord.Message) -> discord.Member | discord.User:
+    if (isinstance(message.author, discord.Member) or message.guild is None or message.webhook_id is not None
+            or parts_cache.authors.get((message.author.id, message.guild.id)) is not None):
+        return message.author
+    # messages fetched over REST carry a user only, the member has the server nickname, avatar and colour
+    member = await member_cache.get((message.guild.id, message.author.id))
+    return member or message.author
+
+
+def build_payload(
+        message: discord.Message,
+        reference_message_id: int | None = None,
+        reference_channel_id: int | None = None,
+        author: discord.Member | discord.User | None = None
+) -> db.ForwardPayload:
+    author = parts_cache.author(author or message.author, message.guild)
+    guild = parts_cache.guild(message.guild)
+    return db.ForwardPayload(
+        message_id=message.id,
+        channel_id=message.channel.id,
+        content=message.content,
+        jump_url=message.jump_url,
+        author_id=message.author.id,
+        author_name=author.name,
+        author_display_name=author.display_name,
+        author_avatar_url=author.avatar_url,
+        colour=author.colour,
+        guild_name=guild.name,
+        guild_icon_url=guild.icon_url,
+        reference_message_id=reference_message_id,
+        reference_channel_id=reference_channel_id,
+        attachments=[
+            db.AttachmentRef(id=a.id, filename=a.filename, url=a.url, size=a.size) for a in message.attachments
+        ]
+    )
+
+
+async def open_attachments(
+        channel: discord.TextChannel,
+        payload: db.ForwardPayload
+) -> tuple[list[discord.File], list[db.AttachmentRef]]:
+    """Opens the spooled files to upload, returns them with the attachments to forward as links instead."""
+    files = []
+    links = []
+    for attachment in payload.attachments[:10]:
+        if attachment.size > channel.guild.filesize_limit:
+            links.append(attachment)
+            continue
+        try:
+            # opened right away, so spool eviction can't remove the file before the upload
+            files.append(discord.File(await attachment_spool.fetch(attachment), filename=attachment.filename))
+        except (AttachmentTooLarge, aiohttp.ClientError, OSError) as e:
+            logger.warning(f'Attachment {attachment.id} forwarded as a link: {e}')
+            links.append(attachment)
+    # a message carries at most 10 files
+    return files, links + payload.attachments[10:]
+
+
+def with_links(content: str, attachments: list[db.AttachmentRef]) -> str:
+    return '\n'.join([content] + [attachment.url for attachment in attachments]).strip()
 
 
 async def bridge_channel_forward_message(
         channel: discord.TextChannel,
         bridge_name: str,
-        message: discord.Message,
-        reference: discord.MessageReference | None = None
+        payload: db.ForwardPayload,
+        deliveries: Sequence[db.Delivery] = (),
+        originals: list[db.ForwardPayload] | None = None,
+        bridge_names: list[str] | None = None
 ):
-    embed = discord.Embed(
-        description=message.content,
-        color=get_user_color(message.author)
+    """
+    Sends a copy of the payload for the outbox `deliveries`, `originals` are the messages merged into it,
+    if it's a burst. `bridge_names` are all bridges the copy is sent for, when the channels share more than one.
+    """
+    bot_message = None
+    if uses_webhook(channel, payload):
+        # webhooks can't reply, replies keep going through the embed
+        bot_message = await webhook_forward_message(channel, bridge_name, payload, deliveries)
+    if bot_message is None:
+        nonce = delivery_nonce(*deliveries) if deliveries else None
+        bot_message = await embed_forward_message(channel, bridge_name, payload, nonce, shared_embed=originals is None)
+
+    # every original is mapped to the copy, so replies to it resolve
+    for original in originals or [payload]:
+        forwarded_message = db.ForwardedMessage(
+            id=bot_message.id,
+            original_id=original.message_id,
+            original_channel_id=original.channel_id,
+            channel_id=channel.id,
+            bridge_name=bridge_name,
+            bridge_names=bridge_names or [bridge_name],
+            webhook_id=bot_message.webhook_id,
+            merged=originals is not None
+        )
+        db.forwarded_messages_buffer.add(forwarded_message)
+        reply_index.add(forwarded_message)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Forwarded message %s to channel %s as %s', payload.message_id, channel.id, bot_message.id)
+
+
+def uses_webhook(channel: discord.TextChannel, payload: db.ForwardPayload) -> bool:
+    return (settings.delivery_mode == DeliveryMode.WEBHOOK and payload.reference_message_id is None
+            and bool(payload.content or payload.attachments) and isinstance(channel, discord.TextChannel))
+
+
+async def webhook_forward_message(
+        channel: discord.TextChannel,
+        bridge_name: str,
+        payload: db.ForwardPayload,
+        deliveries: Sequence[db.Delivery] = ()
+) -> discord.Message | None:
+    username = f'{payload.author_display_name} • {payload.guild_name}'[:80]
+    for _ in range(2):
+        webhook = await webhook_pool.get(channel)
+        if webhook is None:
+            return None
+        started = [delivery.send_started for delivery in deliveries if delivery.send_started is not None]
+        if started:
+            # an earlier send may have gone through before its process stopped, webhook sends carry no nonce
+            posted = await find_webhook_copy(channel, webhook.id, username, payload.content, min(started))
+            if posted is not None:
+                logger.info(f'Copy of message {payload.message_id} found in channel {channel.id}, not resending')
+                return posted
+        if deliveries:
+            await outbox.mark_send_started(deliveries)
+        files, links = await open_attachments(channel, payload)
+        try:
+            with measure('send', bridge_name):
+                webhook_message = await webhook.send(
+                    content=with_links(payload.content, links),
+                    files=files,
+                    username=username,
+                    avatar_url=payload.author_avatar_url,
+                    allowed_mentions=discord.AllowedMentions.none(),
+                    wait=True
+                )
+            SENDS.labels(bridge_name, DeliveryMode.WEBHOOK.value, 'ok').inc()
+            return webhook_message
+        except discord.NotFound:
+            # webhook was deleted in the channel, create a new one
+            SENDS.labels(bridge_name, DeliveryMode.WEBHOOK.value, 'error').inc()
+            logger.warning(f'Webhook {webhook.id} of channel {channel.id} not found')
+            await webhook_pool.evict(channel.id)
+        except discord.HTTPException as e:
+            SENDS.labels(bridge_name, DeliveryMode.WEBHOOK.value, 'error').inc()
+            logger.warning(f'Webhook delivery to channel {channel.id} failed, falling back to embed: {e}')
+            return None
+    return None
+
+
+async def find_webhook_copy(
+        channel: discord.TextChannel,
+        webhook_id: int,
+        username: str,
+        content: str,
+        started: datetime
+) -> discord.Message | None:
+    # Discord's clock may be a bit behind ours
+    after = discord.Object(discord.utils.time_snowflake(started.replace(tzinfo=timezone.utc) - timedelta(seconds=5)))
+    try:
+        async for message in channel.history(limit=100, after=after, oldest_first=True):
+            if (message.webhook_id == webhook_id and message.author.name == username
+                    and message.content.startswith(content)):
+                return message
+    except discord.HTTPException as e:
+        logger.warning(f'Failed to look for an earlier copy in channel {channel.id}: {e}')
+    return None
+
+
+async def embed_forward_message(
+        channel: discord.TextChannel,
+        bridge_name: str,
+        payload: db.ForwardPayload,
+        nonce: str | None = None,
+        shared_embed: bool = True
+) -> discord.Message:
+    with measure('embed', bridge_name):
+        # a merged burst is sent to one channel only
+        embed = embed_cache.get(payload) if shared_embed else build_embed(payload)
+    files, links = await open_attachments(channel, payload)
+    if links:
+        embed = embed.copy()
+        embed.description = with_links(payload.content, links)
+    reference = None
+    if payload.reference_message_id is not None:
+        reference = discord.MessageReference(
+            message_id=payload.reference_message_id,
+            channel_id=payload.reference_channel_id,
+            # original may be deleted already, send as a plain message then
+            fail_if_not_exists=False
+        )
+    try:
+        with measure('send', bridge_name):
+            bot_message = await channel.send(embed=embed, files=files, reference=reference, nonce=nonce)
+    except Exception:
+        SENDS.labels(bridge_name, DeliveryMode.EMBED.value, 'error').inc()
+        raise
+    SENDS.labels(bridge_name, DeliveryMode.EMBED.value, 'ok').inc()
+    return bot_message
+
+
+def new_delivery(bridge_names: Sequence[str], payload: db.ForwardPayload, channel_id: int) -> db.Delivery:
+    return db.Delivery(
+        id=f'{payload.message_id}:{channel_id}',
+        bridge_name=bridge_names[0],
+        bridge_names=list(bridge_names),
+        channel_id=channel_id,
+        payload=payload
     )
-    embed.set_author(name=message.author.name, icon_url=message.author.display_avatar.url, url=message.jump_url)
-    embed.set_footer(text=f'Server: {message.guild.name}', icon_url=message.guild.icon.url)
-    embed.set_thumbnail(url=message.jump_url)
-    bot_message = await channel.send(embed=embed, reference=reference)
-    forwarded_message = db.ForwardedMessage(
-        id=bot_message.id,
-        original_id=message.id,
-        original_channel_id=message.channel.id,
-        channel_id=channel.id,
-        bridge_name=bridge_name
+
+
+def delivery_nonce(*deliveries: db.Delivery) -> str:
+    # Discord nonces are at most 25 characters, enforced nonces make a resent copy return the first one
+    key = '|'.join(delivery.id for delivery in deliveries)
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
+async def forward(deliveries: list[db.Delivery]) -> list[db.Delivery]:
+    """Writes the copies to the outbox and sends those to channels of this process, returns the failed ones."""
+    channel_ids = list({delivery.channel_id for delivery in deliveries})
+    # resolved concurrently, a channel that fails to fetch only misses its own copy
+    channels = await asyncio.gather(*(channel_cache.get(channel_id) for channel_id in channel_ids))
+    local_channel_ids = {channel_id for channel_id, channel in zip(channel_ids, channels) if channel is not None}
+    if not MULTI_PROCESS:
+        for delivery in deliveries:
+            if delivery.channel_id not in local_channel_ids:
+                logger.error(f'Channel {delivery.channel_id} not found for bridge {delivery.bridge_name}')
+        deliveries = [delivery for delivery in deliveries if delivery.channel_id in local_channel_ids]
+
+    # written before sending, so copies in flight during a restart are replayed
+    with measure('outbox', deliveries[0].bridge_name if deliveries else ''):
+        claimed = await outbox.enqueue(deliveries, local_channel_ids)
+    return await deliver_claimed(claimed)
+
+
+async def skip_unreachable(deliveries: list[db.Delivery]) -> None:
+    for delivery in deliveries:
+        if MULTI_PROCESS:
+            # the lease runs out and the owner of the channel sends it
+            outbox.release(delivery)
+        else:
+            # no other process can reach the channel, retried with backoff until it's given up
+            await outbox.fail(delivery)
+
+
+async def deliver(delivery: db.Delivery) -> None:
+    channel = await channel_cache.get(delivery.channel_id)
+    if channel is None:
+        logger.warning(f'Channel {delivery.channel_id} of delivery {delivery.id} not found')
+        await skip_unreachable([delivery])
+        return
+
+    key = (delivery.bridge_name, channel.id)
+    window = routing_index.coalesce_seconds(delivery.bridge_name)
+    if window and can_coalesce(delivery.payload):
+        # acked or failed when the burst is sent
+        burst_coalescer.add(key, delivery, window)
+        return
+    if burst_coalescer.pending(key):
+        # keeps the channel in order, the burst goes before this message
+        await burst_coalescer.flush(key)
+
+    try:
+        # queued per destination channel, so a rate-limited channel doesn't hold up the others
+        await send_scheduler.submit(
+            channel.id,
+            lambda: bridge_channel_forward_message(
+                channel, delivery.bridge_name, delivery.payload, [delivery], bridge_names=delivery.bridge_names
+            )
+        )
+    except Exception:
+        await outbox.fail(delivery)
+        raise
+    outbox.ack(delivery)
+
+
+def can_coalesce(payload: db.ForwardPayload) -> bool:
+    # replies and attachments need a message of their own
+    return bool(payload.content) and payload.reference_message_id is None and not payload.attachments
+
+
+def split_burst(deliveries: list[db.Delivery], limit: int, by_author: bool) -> list[list[db.Delivery]]:
+    """Splits a burst into runs that fit one message, each from one source channel and optionally one author."""
+    chunks: list[list[db.Delivery]] = []
+    size = 0
+    for delivery in deliveries:
+        payload = delivery.payload
+        # counted with the author prefix, a run may turn out to have several authors
+        line_size = len(payload.content) + (0 if by_author else len(burst_prefix(payload)))
+        if chunks:
+            last = chunks[-1][-1].payload
+            if (size + 1 + line_size <= limit and last.channel_id == payload.channel_id
+                    and (not by_author or last.author_id == payload.author_id)):
+                chunks[-1].append(delivery)
+                size += 1 + line_size
+                continue
+        chunks.append([delivery])
+        size = line_size
+    return chunks
+
+
+def burst_prefix(payload: db.ForwardPayload) -> str:
+    return f'**{payload.author_display_name}**: '
+
+
+def merge_payloads(payloads: list[db.ForwardPayload]) -> db.ForwardPayload:
+    first = payloads[0]
+    if all(payload.author_id == first.author_id for payload in payloads):
+        return dataclasses.replace(first, content='\n'.join(payload.content for payload in payloads))
+
+    names = list(dict.fromkeys(payload.author_display_name for payload in payloads))
+    author_name = ', '.join(names[:2]) + (f' and {len(names) - 2} more' if len(names) > 2 else '')
+    return dataclasses.replace(
+        first,
+        content='\n'.join(burst_prefix(payload) + payload.content for payload in payloads),
+        author_name=author_name
     )
-    db.forwarded_messages.create(forwarded_message)
-    logger.debug(f'Forwarded message {forwarded_message}')
 
 
-async def bridge_forward_message(
-        bridge_name: str,
-        message: discord.Message,
-        channel_id: int,
-        reference: discord.MessageReference | None = None
-):
-    channel = bot.get_channel(channel_id)
+async def forward_burst(channel: discord.TextChannel, bridge_name: str, chunk: list[db.Delivery]) -> None:
+    # a run comes from one source channel, so its deliveries share the bridges
+    bridge_names = chunk[0].bridge_names
+    if len(chunk) == 1:
+        await bridge_channel_forward_message(
+            channel, bridge_name, chunk[0].payload, chunk, bridge_names=bridge_names
+        )
+        return
+    payloads = [delivery.payload for delivery in chunk]
+    await bridge_channel_forward_message(
+        channel, bridge_name, merge_payloads(payloads), chunk, originals=payloads,
+        bridge_names=bridge_names
+    )
+
+
+async def send_burst(key: tuple[str, int], deliveries: list[db.Delivery]) -> None:
+    bridge_name, channel_id = key
+    channel = await channel_cache.get(channel_id)
     if channel is None:
-        logger.error(f'Channel {channel_id} not found for bridge {bridge_name}')
+        logger.warning(f'Channel {channel_id} of burst {[delivery.id for delivery in deliveries]} not found')
+        await skip_unreachable(deliveries)
+        return
 
-    await bridge_channel_forward_message(channel, bridge_name, message, reference)
+    if uses_webhook(channel, deliveries[0].payload):
+        chunks = split_burst(deliveries, MESSAGE_CONTENT_LIMIT, by_author=True)
+    else:
+        chunks = split_burst(deliveries, EMBED_DESCRIPTION_LIMIT, by_author=False)
+    # all queued right away, so messages after the burst can't overtake it
+    sends = [
+        (chunk, send_scheduler.submit(channel.id, lambda chunk=chunk: forward_burst(channel, bridge_name, chunk)))
+        for chunk in chunks
+    ]
+    for chunk, send in sends:
+        try:
+            await send
+        except Exception:
+            logger.exception(f'Burst of {len(chunk)} messages to channel {channel_id} failed')
+            for delivery in chunk:
+                await outbox.fail(delivery)
+            continue
+        for delivery in chunk:
+            outbox.ack(delivery)
+    if len(chunks) < len(deliveries):
+        logger.debug('Merged %s messages of bridge %s into %s copies', len(deliveries), bridge_name, len(chunks))
 
 
-async def bridge_send_message(bridge_channel: db.BridgeChannel, message: discord.Message):
-    bridge = db.bridges.get_one(name=bridge_channel.bridge_name)
-    if bridge is None:
-        logger.error(f'Bridge {bridge_channel.bridge_name} not found for channel {bridge_channel.id}')
+burst_coalescer = Coalescer[tuple[str, int], db.Delivery](send_burst)
+
+
+async def deliver_claimed(deliveries: list[db.Delivery]) -> list[db.Delivery]:
+    failed = await fan_out(deliveries, deliver, settings.fanout_max_concurrency)
+    if failed:
+        logger.warning(f'Deliveries {[delivery.id for delivery in failed]} failed')
+    return failed
+
+
+def owned_channel_ids() -> list[int]:
+    return [channel_id for channel_id in routing_index.channel_ids() if bot.get_channel(channel_id) is not None]
+
+
+async def replay() -> None:
+    """Sends the copies left in the outbox, then catches up with messages that arrived while the bot was away."""
+    replayed = await outbox.drain(owned_channel_ids(), deliver_claimed)
+    if replayed:
+        logger.info(f'Replayed {replayed} outbox entries')
+    for channel_id in owned_channel_ids():
+        try:
+            await catch_up(bot.get_channel(channel_id))
+        except Exception:
+            logger.exception(f'Failed to catch up with channel {channel_id}')
+    await backfiller.resume(owned_channel_ids())
+
+
+async def catch_up(channel: discord.TextChannel) -> None:
+    last = await db.bridge_messages.get_last('id', channel_id=channel.id)
+    buffered = db.bridge_messages_buffer.find(channel_id=channel.id)
+    last_id = max([bridge_message.id for bridge_message in buffered + ([last] if last else [])], default=None)
+    if last_id is None:
         return
-    if len(bridge.channel_ids) <= 1:
-        logger.warning(f'Bridge {bridge_channel.bridge_name} has only one channel, nowhere to forward.')
+
+    count = 0
+    # the outbox idempotency keys skip messages that were forwarded already
+    history = channel.history(limit=settings.catch_up_limit, after=discord.Object(last_id), oldest_first=True)
+    async for message in history:
+        await handle_message(message)
+        count += 1
+    if count:
+        logger.info(f'Caught up with {count} messages of channel {channel.id}')
+
+
+async def backfill_delivery(bridge_name: str, message: discord.Message, channel_id: int) -> db.Delivery:
+    return new_delivery([bridge_name], build_payload(message, author=await message_author(message)), channel_id)
+
+
+backfiller = Backfiller(
+    outbox,
+    channel_cache.get,
+    lambda message: is_own_message(message) or message_is_command(message),
+    backfill_delivery,
+    deliver
+)
+
+
+async def bridge_send_message(plan: FanOutPlan, message: discord.Message):
+    if len(plan.targets) == 0:
+        logger.warning(f'Bridges {list(plan.bridge_names)} have only one channel, nowhere to forward.')
         return
 
     bridge_message = db.BridgeMessage(
@@ -374,52 +1127,146 @@ async def bridge_send_message(bridge_channel: db.BridgeChannel, message: discord
         text=message.content,
         author_id=message.author.id,
         channel_id=message.channel.id,
-        bridge_name=bridge.name
+        bridge_name=plan.bridge_names[0],
+        bridge_names=list(plan.bridge_names),
+        guild_id=message.guild.id if message.guild is not None else None
     )
-    db.bridge_messages.create(bridge_message)
-    logger.debug(f'Forwarding message {bridge_message.id} to bridge {bridge.name}')
+    db.bridge_messages_buffer.add(bridge_message)
+    logger.debug('Forwarding message %s to bridges %s', bridge_message.id, plan.bridge_names)
+
+    payload = build_payload(message, author=await message_author(message))
+    # one copy per target channel, however many bridges lead there
+    deliveries = [new_delivery(bridge_names, payload, channel_id) for channel_id, bridge_names in plan.targets]
+    failed = await forward(deliveries)
+    if failed:
+        logger.warning(
+            f'Message {message.id} not forwarded to channels {[delivery.channel_id for delivery in failed]} '
+            f'of bridges {list(plan.bridge_names)}'
+        )
 
-    for channel_id in bridge.channel_ids:
-        if channel_id == bridge_channel.id:
-            # skip current channel
-            continue
 
-        await bridge_forward_message(bridge.name, message, channel_id)
+async def find_copies(original_id: int) -> list[db.ForwardedMessage]:
+    copies = await db.forwarded_messages_buffer.get_many(original_id=original_id)
+    # rows being flushed can show up both in the buffer and in the db
+    return list({copy.id: copy for copy in copies}.values())
+
+
+def copy_message(copy: db.ForwardedMessage) -> discord.PartialMessage:
+    # REST only, so copies in channels of other processes' shards are edited and deleted too
+    return bot.get_partial_messageable(copy.channel_id).get_partial_message(copy.id)
+
+
+async def edit_copy(copy: db.ForwardedMessage, payload: db.ForwardPayload) -> None:
+    if copy.merged:
+        # other messages share the copy, it keeps the content it was sent with
+        logger.debug(f'Copy {copy.id} is a merged burst, not editing')
+        return
+
+    with measure('edit', copy.bridge_name):
+        if copy.webhook_id is None:
+            await copy_message(copy).edit(embed=embed_cache.get(payload))
+            return
+        webhook = webhook_pool.get_cached(copy.channel_id)
+        if webhook is None or webhook.id != copy.webhook_id:
+            logger.warning(f'Webhook {copy.webhook_id} of copy {copy.id} is gone, not editing')
+            return
+        await webhook.edit_message(copy.id, content=payload.content, allowed_mentions=discord.AllowedMentions.none())
+
+
+async def delete_copy(copy: db.ForwardedMessage) -> None:
+    if copy.merged:
+        # other messages share the copy
+        logger.debug(f'Copy {copy.id} is a merged burst, not deleting')
+        return
+
+    with measure('delete', copy.bridge_name):
+        try:
+            webhook = webhook_pool.get_cached(copy.channel_id) if copy.webhook_id is not None else None
+            if webhook is not None and webhook.id == copy.webhook_id:
+                await webhook.delete_message(copy.id)
+            else:
+                # the bot can delete webhook messages too, given manage messages permission
+                await copy_message(copy).delete()
+        except discord.NotFound:
+            pass
+
+
+async def propagate_edit(message_id: int, message: discord.Message) -> None:
+    """Applies the latest version of an edited message to its copies."""
+    copies = await find_copies(message_id)
+    if not copies:
+        return
+
+    embed_cache.invalidate(message_id)
+    payload = build_payload(message, author=await message_author(message))
+    failed = await fan_out(
+        copies,
+        lambda copy: send_scheduler.submit(copy.channel_id, lambda: edit_copy(copy, payload)),
+        settings.fanout_max_concurrency
+    )
+    if failed:
+        logger.warning(f'Edit of message {message_id} not propagated to copies {[copy.id for copy in failed]}')
+
+
+edit_debouncer: Debouncer[int, discord.Message] = Debouncer(settings.edit_coalesce_seconds, propagate_edit)
+# last edited timestamp seen per original, updates that keep it are unfurls
+edit_stamps: LruCache[int, datetime] = LruCache(10_000)
+
+
+async def propagate_delete(message_id: int) -> None:
+    edit_debouncer.cancel(message_id)
+    copies = await find_copies(message_id)
+    if not copies:
+        return
+
+    failed = await fan_out(
+        copies,
+        lambda copy: send_scheduler.submit(copy.channel_id, lambda: delete_copy(copy)),
+        settings.fanout_max_concurrency
+    )
+    if failed:
+        logger.warning(f'Delete of message {message_id} not propagated to copies {[copy.id for copy in failed]}')
+    if db.forwarded_messages_buffer.find(original_id=message_id):
+        await db.forwarded_messages_buffer.flush()
+    await db.forwarded_messages.remove_by(original_id=message_id)
 
 
 def message_is_command(message: discord.Message) -> bool:
     return message.content is not None and message.content.startswith(COMMAND_PREFIX)
 
 
-async def handle_bridge_message(message: discord.Message):
-    bridge_channels = db.bridge_channels.get_many(id=message.channel.id)
-    if len(bridge_channels) == 0:
-        return
+async def handle_bridge_message(message: discord.Message) -> bool:
+    with measure('routing'):
+        plan = routing_index.plan(message.channel.id)
+    if plan is None:
+        return False
 
-    for bridge_channel in bridge_channels:
-        await bridge_send_message(bridge_channel, message)
+    await bridge_send_message(plan, message)
+    return True
 
 
 async def handle_reply_message(message: discord.Message) -> bool:
     if message.reference is None:
         return False
 
-    forwarded_message = db.forwarded_messages.get_one(id=message.reference.message_id)
+    with measure('reply'):
+        forwarded_message = await reply_index.get(message.reference.message_id)
     if forwarded_message is None:
-        # has reply but not to bridge message
+        # has reply but not to bridge message, or the mapping is past retention
         return False
 
-    await bridge_forward_message(
-        forwarded_message.bridge_name,
+    payload = build_payload(
         message,
-        forwarded_message.original_channel_id,
-        reference=discord.MessageReference(
-            message_id=forwarded_message.original_id,
-            channel_id=forwarded_message.original_channel_id
-        )
+        reference_message_id=forwarded_message.original_id,
+        reference_channel_id=forwarded_message.original_channel_id,
+        author=await message_author(message)
     )
+    bridge_names = forwarded_message.bridge_names or [forwarded_message.bridge_name]
+    await forward([new_delivery(bridge_names, payload, forwarded_message.original_channel_id)])
     return True
 
 
 if __name__ == '__main__':
     bot.run(settings.discord_api_token, log_handler=None)
+    # after the event loop is gone, so records of the shutdown are written too
+    stop_logging()
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import time
+from typing import Iterable
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+STAGE_SECONDS = Histogram(
+    'bridge_stage_seconds', 'Latency of forwarding pipeline stages', ['stage', 'bridge'], buckets=LATENCY_BUCKETS
+)
+DB_SECONDS = Histogram(
+    'bridge_db_seconds', 'Latency of db calls, including executor queueing', ['collection', 'operation'],
+    buckets=LATENCY_BUCKETS
+)
+DB_WRITES = Counter(
+    'bridge_db_writes_total', 'Rows of buffered and outbox inserts', ['collection', 'bridge', 'result']
+)
+MESSAGES = Counter('bridge_messages_total', 'Messages handled by on_message', ['kind'])
+SENDS = Counter('bridge_sends_total', 'Forwarded copies sent to Discord', ['bridge', 'mode', 'result'])
+# summed over the channels of a bridge, a label per channel would grow with every channel ever bridged
+SEND_QUEUE_DEPTH = Gauge('bridge_send_queue_depth', 'Sends waiting in the channel queues of a bridge', ['bridge'])
+SEND_QUEUE_WAIT_SECONDS = Histogram(
+    'bridge_send_queue_wait_seconds', 'Time sends wait in the destination channel queue', buckets=LATENCY_BUCKETS
+)
+CACHE_HITS = Gauge('bridge_cache_hits', 'Cache hits', ['cache'])
+CACHE_MISSES = Gauge('bridge_cache_misses', 'Cache misses', ['cache'])
+LOG_RECORDS_DROPPED = Counter('bridge_log_records_dropped_total', 'Log records dropped by the full log queue')
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    'bridge_event_loop_lag_seconds', 'How late the event loop wakes up sleeping tasks', buckets=LATENCY_BUCKETS
+)
+
+
+def measure(stage: str, bridge: str = ''):
+    return STAGE_SECONDS.labels(stage, bridge).time()
+
+
+def count_writes(collection: str, bridge_names: Iterable[str], result: str) -> None:
+    # inserts are batched across bridges, counted per bridge of each row
+    counts: dict[str, int] = {}
+    for bridge_name in bridge_names:
+        counts[bridge_name] = counts.get(bridge_name, 0) + 1
+    for bridge_name, count in counts.items():
+        DB_WRITES.labels(collection, bridge_name, result).inc(count)
+
+
+def start_metrics_server(port: int) -> None:
+    # serves /metrics from a daemon thread, metric objects are thread-safe
+    start_http_server(port)
+    logger.info(f'Serving metrics on port {port}')
+
+
+async def monitor_event_loop(interval: float, on_tick: callable = None) -> None:
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.monotonic() - started - interval))
+        if on_tick is not None:
+            on_tick()
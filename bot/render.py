@@ -0,0 +1,99 @@
+import logging
+from dataclasses import dataclass
+
+import discord
+
+from bot import db
+from bot.cache import LruCache
+from env import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AuthorParts:
+    name: str
+    display_name: str
+    avatar_url: str
+    colour: db.Colour
+
+
+@dataclass(frozen=True)
+class GuildParts:
+    name: str
+    icon_url: str | None
+
+
+def get_user_color(user: discord.User) -> discord.Colour:
+    if not user.colour:
+        return discord.Colour.green()
+    return user.colour
+
+
+# Author parts per (user, guild) and guild parts per guild, the same for every message until a profile
+# or guild update. The TTL covers updates the bot doesn't get events for without the members intent.
+class PartsCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.authors: LruCache[tuple[int, int], AuthorParts] = LruCache(max_size, ttl)
+        self.guilds: LruCache[int, GuildParts] = LruCache(max_size, ttl)
+
+    def author(self, member: discord.Member | discord.User, guild: discord.Guild) -> AuthorParts:
+        parts = self.authors.get((member.id, guild.id))
+        if parts is None:
+            parts = AuthorParts(
+                name=member.name,
+                display_name=member.display_name,
+                avatar_url=member.display_avatar.url,
+                colour=db.Colour.from_discord(get_user_color(member))
+            )
+            self.authors.put((member.id, guild.id), parts)
+        return parts
+
+    def guild(self, guild: discord.Guild) -> GuildParts:
+        parts = self.guilds.get(guild.id)
+        if parts is None:
+            parts = GuildParts(name=guild.name, icon_url=guild.icon.url if guild.icon is not None else None)
+            self.guilds.put(guild.id, parts)
+        return parts
+
+    def invalidate_user(self, user_id: int) -> None:
+        self.authors.pop_where(lambda key: key[0] == user_id)
+
+    def invalidate_member(self, user_id: int, guild_id: int) -> None:
+        self.authors.pop((user_id, guild_id))
+
+    def invalidate_guild(self, guild_id: int) -> None:
+        self.guilds.pop(guild_id)
+        self.authors.pop_where(lambda key: key[1] == guild_id)
+
+
+def build_embed(payload: db.ForwardPayload) -> discord.Embed:
+    embed = discord.Embed(
+        description=payload.content,
+        color=discord.Colour(payload.colour.value)
+    )
+    embed.set_author(name=payload.author_name, icon_url=payload.author_avatar_url, url=payload.jump_url)
+    embed.set_footer(text=f'Server: {payload.guild_name}', icon_url=payload.guild_icon_url)
+    embed.set_thumbnail(url=payload.jump_url)
+    return embed
+
+
+# Embeds of recently forwarded messages, so a fan-out builds one embed for all its copies.
+# Sending only reads the embed, copies that change it must copy() it first.
+class EmbedCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.embeds: LruCache[int, discord.Embed] = LruCache(max_size, ttl)
+
+    def get(self, payload: db.ForwardPayload) -> discord.Embed:
+        embed = self.embeds.get(payload.message_id)
+        if embed is None:
+            embed = build_embed(payload)
+            self.embeds.put(payload.message_id, embed)
+        return embed
+
+    def invalidate(self, message_id: int) -> None:
+        self.embeds.pop(message_id)
+
+
+parts_cache = PartsCache(settings.user_cache_size, settings.user_cache_ttl_seconds)
+embed_cache = EmbedCache(1024, 60.0)
@@ -0,0 +1,70 @@
+import logging
+
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+
+from bot import db
+from bot.cache import LruCache, BloomFilter
+from env import settings
+
+logger = logging.getLogger(__name__)
+
+LOAD_BATCH_SIZE = 50_000
+
+
+# Resolves replies to forwarded copies: recent copies from memory, and a Bloom filter of all known copy ids
+# lets replies to non-bridge messages skip the db entirely
+class ReplyIndex:
+    def __init__(self, cache_size: int, cache_ttl: float, filter_capacity: int, filter_error_rate: float):
+        self.cache: LruCache[int, db.ForwardedMessage] = LruCache(cache_size, cache_ttl)
+        self.known_ids = BloomFilter(filter_capacity, filter_error_rate)
+        self.loaded = False
+        self.filtered = 0
+
+    def add(self, forwarded_message: db.ForwardedMessage) -> None:
+        self.known_ids.add(forwarded_message.id)
+        self.cache.put(forwarded_message.id, forwarded_message)
+
+    async def get(self, message_id: int) -> db.ForwardedMessage | None:
+        forwarded_message = self.cache.get(message_id)
+        if forwarded_message is not None:
+            return forwarded_message
+        if self.loaded and message_id not in self.known_ids:
+            self.filtered += 1
+            return None
+
+        forwarded_message = await db.forwarded_messages_buffer.get_one(id=message_id)
+        if forwarded_message is not None:
+            self.cache.put(message_id, forwarded_message)
+        return forwarded_message
+
+    async def load(self) -> None:
+        collection = db.forwarded_messages.sync.collection
+        last_id = None
+        count = 0
+        while True:
+            docs = await db.forwarded_messages.run(find_id_batch, collection, last_id)
+            if not docs:
+                break
+            # filled on the event loop, so it never races with add()
+            for doc in docs:
+                self.known_ids.add(doc['id'])
+            last_id = docs[-1]['_id']
+            count += len(docs)
+
+        self.loaded = True
+        logger.info(f'Loaded {count} forwarded message ids into the reply filter')
+
+
+def find_id_batch(collection: Collection, last_id: ObjectId | None) -> list[dict]:
+    query = {} if last_id is None else {'_id': {'$gt': last_id}}
+    return list(collection.find(query, {'id': 1}).sort('_id', ASCENDING).limit(LOAD_BATCH_SIZE))
+
+
+reply_index = ReplyIndex(
+    settings.reply_cache_size,
+    settings.reply_cache_ttl_minutes * 60,
+    settings.reply_filter_capacity,
+    settings.reply_filter_error_rate
+)
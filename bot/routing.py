@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+
+from pymongo.errors import PyMongoError
+
+from bot import db
+
+logger = logging.getLogger(__name__)
+
+
+# Where a message from one source channel goes across all its bridges: every target channel once,
+# with the bridges it's reached through
+@dataclass(frozen=True)
+class FanOutPlan:
+    bridge_names: tuple[str, ...]
+    # the first bridge of a target sends the copy
+    targets: tuple[tuple[int, tuple[str, ...]], ...]
+
+
+# channel_id -> bridges map kept in memory, so messages from non-bridged channels need no db round-trips
+class RoutingIndex:
+    def __init__(self):
+        self._bridge_channel_ids: dict[str, tuple[int, ...]] = {}
+        self._channel_bridges: dict[int, set[str]] = {}
+        # burst coalescing window of bridges that have it on
+        self._coalesce_seconds: dict[str, float] = {}
+        # plans per source channel, dropped on every routing change
+        self._plans: dict[int, FanOutPlan] = {}
+        self._watch_thread: threading.Thread | None = None
+
+    def plan(self, channel_id: int) -> FanOutPlan | None:
+        plan = self._plans.get(channel_id)
+        if plan is not None:
+            return plan
+        bridge_names = self._channel_bridges.get(channel_id)
+        if not bridge_names:
+            return None
+
+        bridge_names = tuple(sorted(bridge_names))
+        targets: dict[int, list[str]] = {}
+        for bridge_name in bridge_names:
+            for target_id in self._bridge_channel_ids[bridge_name]:
+                if target_id != channel_id:
+                    targets.setdefault(target_id, []).append(bridge_name)
+        plan = FanOutPlan(bridge_names, tuple((target_id, tuple(names)) for target_id, names in targets.items()))
+        self._plans[channel_id] = plan
+        return plan
+
+    def channel_ids(self) -> list[int]:
+        return list(self._channel_bridges)
+
+    def bridge_channel_ids(self, bridge_name: str) -> tuple[int, ...]:
+        return self._bridge_channel_ids.get(bridge_name, ())
+
+    def coalesce_seconds(self, bridge_name: str) -> float | None:
+        return self._coalesce_seconds.get(bridge_name)
+
+    def set_coalescing(self, bridge_name: str, seconds: float | None) -> None:
+        if seconds:
+            self._coalesce_seconds[bridge_name] = seconds
+        else:
+            self._coalesce_seconds.pop(bridge_name, None)
+
+    def set_bridge(self, bridge_name: str, channel_ids: list[int]) -> None:
+        # channels only, coalescing is kept, deleted bridges drop it with the reload of the whole index
+        self._plans = {}
+        for channel_id in self._bridge_channel_ids.pop(bridge_name, ()):
+            self._unlink(bridge_name, channel_id)
+        self._bridge_channel_ids[bridge_name] = tuple(dict.fromkeys(channel_ids))
+        for channel_id in channel_ids:
+            self._channel_bridges.setdefault(channel_id, set()).add(bridge_name)
+
+    def _unlink(self, bridge_name: str, channel_id: int) -> None:
+        bridge_names = self._channel_bridges.get(channel_id)
+        if bridge_names is None:
+            return
+        bridge_names.discard(bridge_name)
+        if not bridge_names:
+            del self._channel_bridges[channel_id]
+
+    async def load(self) -> None:
+        bridges = await db.bridges.get_projected(['name', 'channel_ids', 'coalesce_seconds'])
+        self._bridge_channel_ids = {}
+        self._channel_bridges = {}
+        self._coalesce_seconds = {}
+        self._plans = {}
+        for bridge in bridges:
+            self.set_bridge(bridge['name'], bridge['channel_ids'] or [])
+            self.set_coalescing(bridge['name'], bridge['coalesce_seconds'])
+        logger.info(f'Loaded routing index: {len(self._bridge_channel_ids)} bridges, '
+                    f'{len(self._channel_bridges)} channels')
+
+    async def refresh_periodically(self, interval: float) -> None:
+        """Reloads the index, picks up bridges changed by other bot processes when change streams are off."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load()
+            except PyMongoError as e:
+                logger.error(f'Failed to refresh routing index: {e}')
+
+    def watch(self) -> None:
+        """Keeps the index fresh from the bridges change stream, requires Mongo replica set."""
+        if self._watch_thread is not None:
+            return
+        loop = asyncio.get_running_loop()
+        # daemon thread, so the blocking stream never holds up shutdown
+        self._watch_thread = threading.Thread(
+            target=self._watch_blocking, args=(loop,), name='routing-watch', daemon=True
+        )
+        self._watch_thread.start()
+
+    def _watch_blocking(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            with db.bridges.sync.collection.watch(full_document='updateLookup') as stream:
+                for change in stream:
+                    loop.call_soon_threadsafe(self._apply_change, change)
+        except PyMongoError as e:
+            logger.error(f'Routing index change stream stopped: {e}')
+            self._watch_thread = None
+
+    def _apply_change(self, change: dict) -> None:
+        operation = change['operationType']
+        document = change.get('fullDocument')
+        if operation in ('insert', 'update', 'replace') and document is not None:
+            self.set_bridge(document['name'], document.get('channel_ids', []))
+            self.set_coalescing(document['name'], document.get('coalesce_seconds'))
+        elif operation == 'delete':
+            # delete events carry only _id, rebuild the whole index
+            asyncio.ensure_future(self.load())
+
+
+routing_index = RoutingIndex()
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+
+from bot.metrics import SEND_QUEUE_WAIT_SECONDS
+from env import settings
+
+logger = logging.getLogger(__name__)
+
+ROUTE_PATTERN = re.compile(r'/(channels|webhooks)/(\d+)')
+
+
+@dataclass
+class RateLimitBucket:
+    bucket: str | None
+    remaining: int
+    reset_at: float
+
+
+# Tracks Discord rate-limit buckets of message sends from response headers, per destination channel
+class RateLimitTracker:
+    def __init__(self):
+        self._buckets: dict[int, RateLimitBucket] = {}
+        self._webhook_channels: dict[int, int] = {}
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(self._on_request_end)
+        return trace_config
+
+    def link_webhook(self, webhook_id: int, channel_id: int) -> None:
+        self._webhook_channels[webhook_id] = channel_id
+
+    def channel_id(self, url: str) -> int | None:
+        match = ROUTE_PATTERN.search(url)
+        if match is None:
+            return None
+        kind, snowflake = match.group(1), int(match.group(2))
+        return snowflake if kind == 'channels' else self._webhook_channels.get(snowflake)
+
+    async def _on_request_end(self, session, context, params: aiohttp.TraceRequestEndParams) -> None:
+        if params.method != 'POST':
+            return
+        channel_id = self.channel_id(params.url.path)
+        if channel_id is None:
+            return
+        headers = params.response.headers
+        if params.response.status == 429:
+            self.update(channel_id, headers.get('X-RateLimit-Bucket'), 0, float(headers.get('Retry-After', 1)))
+        elif 'X-RateLimit-Remaining' in headers:
+            self.update(
+                channel_id,
+                headers.get('X-RateLimit-Bucket'),
+                int(headers['X-RateLimit-Remaining']),
+                float(headers.get('X-RateLimit-Reset-After', 0))
+            )
+
+    def update(self, channel_id: int, bucket: str | None, remaining: int, reset_after: float) -> None:
+        self._buckets[channel_id] = RateLimitBucket(bucket, remaining, time.monotonic() + reset_after)
+
+    def consume(self, channel_id: int) -> None:
+        bucket = self._buckets.get(channel_id)
+        if bucket is not None:
+            bucket.remaining -= 1
+
+    def delay(self, channel_id: int) -> float:
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            return 0.0
+        now = time.monotonic()
+        if now >= bucket.reset_at:
+            del self._buckets[channel_id]
+            return 0.0
+        return bucket.reset_at - now if bucket.remaining <= 0 else 0.0
+
+
+@dataclass
+class SendJob:
+    send: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class ChannelQueueStats:
+    channel_id: int
+    depth: int = 0
+    sent: int = 0
+    failed: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+
+# One FIFO send queue and worker task per destination channel,
+# so a rate-limited channel only delays its own messages
+class SendScheduler:
+    def __init__(self, rate_limits: RateLimitTracker, max_concurrency: int, idle_timeout: float = 60.0):
+        self.rate_limits = rate_limits
+        self.idle_timeout = idle_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._queues: dict[int, asyncio.Queue[SendJob]] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self._stats: dict[int, ChannelQueueStats] = {}
+
+    def submit(self, channel_id: int, send: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        job = SendJob(send, asyncio.get_running_loop().create_future())
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = asyncio.Queue()
+            self._workers[channel_id] = asyncio.create_task(self._work(channel_id, queue))
+        queue.put_nowait(job)
+        return job.future
+
+    async def _work(self, channel_id: int, queue: asyncio.Queue[SendJob]) -> None:
+        stats = self._stats.setdefault(channel_id, ChannelQueueStats(channel_id))
+        while True:
+            try:
+                job = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self._queues[channel_id]
+                    del self._workers[channel_id]
+                    return
+                continue
+
+            while (delay := self.rate_limits.delay(channel_id)) > 0:
+                logger.debug('Channel %s is rate-limited, waiting %.2fs', channel_id, delay)
+                await asyncio.sleep(delay)
+
+            async with self._semaphore:
+                wait_seconds = time.monotonic() - job.enqueued_at
+                stats.wait_seconds_total += wait_seconds
+                stats.wait_seconds_max = max(stats.wait_seconds_max, wait_seconds)
+                SEND_QUEUE_WAIT_SECONDS.observe(wait_seconds)
+                self.rate_limits.consume(channel_id)
+                try:
+                    result = await job.send()
+                    stats.sent += 1
+                    if not job.future.done():
+                        job.future.set_result(result)
+                except Exception as e:
+                    stats.failed += 1
+                    if not job.future.done():
+                        job.future.set_exception(e)
+
+    def stats(self) -> list[ChannelQueueStats]:
+        for channel_id, stats in self._stats.items():
+            queue = self._queues.get(channel_id)
+            stats.depth = queue.qsize() if queue is not None else 0
+        return list(self._stats.values())
+
+    async def close(self) -> None:
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+
+
+rate_limits = RateLimitTracker()
+send_scheduler = SendScheduler(rate_limits, settings.send_max_concurrency, settings.send_queue_idle_seconds)
@@ -0,0 +1,49 @@
+import math
+import re
+from datetime import datetime
+
+from pymongo.collection import Collection
+
+# relevance of a $text match, projected into the result and sorted by
+SCORE = {'$meta': 'textScore'}
+# `days:N` anywhere in the query limits the search to the last N days
+DAYS_TOKEN = re.compile(r'(?<!\S)days:(\S*)(?!\S)', re.IGNORECASE)
+# longer ranges are clamped, so the time range always fits a timedelta
+MAX_DAYS = 3650.0
+
+
+def parse_query(query: str, default_days: float) -> tuple[str, float]:
+    """Splits the `days:N` token off the query, raises ValueError when N is not a number."""
+    days = default_days
+    match = DAYS_TOKEN.search(query)
+    if match is not None:
+        days = float(match.group(1))
+        if not math.isfinite(days):
+            raise ValueError(f'days must be finite: {days}')
+        query = (query[:match.start()] + query[match.end():]).strip()
+    return ' '.join(query.split()), min(max(days, 0.0), MAX_DAYS)
+
+
+def search_filters(bridge_name: str, primary_names: list[str], query: str, since: datetime) -> list[dict]:
+    """
+    One filter per bridge the messages may be stored under. A message of a channel in several bridges is stored
+    once, under the first of them, so bridges that share channels with the searched one are searched too.
+    Every filter matches the text index prefix by equality, so a search only reads that bridge's part of it.
+    """
+    filters = []
+    for primary_name in primary_names:
+        text_filter = {'bridge_name': primary_name, '$text': {'$search': query}, 'created': {'$gte': since}}
+        if primary_name != bridge_name:
+            text_filter['bridge_names'] = bridge_name
+        filters.append(text_filter)
+    return filters
+
+
+def find_text(collection: Collection, filters: list[dict], limit: int, max_time_ms: int) -> list[dict]:
+    """Best `limit` matches of all filters, each query is stopped by the server after `max_time_ms`."""
+    docs = []
+    for text_filter in filters:
+        cursor = collection.find(text_filter, {'score': SCORE}).sort([('score', SCORE)]).limit(limit)
+        docs += list(cursor.max_time_ms(max_time_ms))
+    docs.sort(key=lambda doc: (doc['score'], doc['id']), reverse=True)
+    return docs[:limit]
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+import discord
+
+from bot import db
+from bot.cache import LruCache
+from bot.scheduler import RateLimitTracker
+from env import settings
+
+logger = logging.getLogger(__name__)
+
+
+# One webhook per bridged channel, cached in memory and persisted in channel_webhooks
+class WebhookPool:
+    def __init__(self, client: discord.Client, rate_limits: RateLimitTracker):
+        self.client = client
+        self.rate_limits = rate_limits
+        self._stored: dict[int, db.ChannelWebhook] = {}
+        self._webhooks: dict[int, discord.Webhook] = {}
+        self._webhook_ids: set[int] = set()
+        self._locks: dict[int, asyncio.Lock] = {}
+        # channels without Manage Webhooks, not asked again until the entry expires
+        self._unavailable = LruCache[int, bool](10_000, settings.webhook_retry_seconds)
+
+    async def load(self) -> None:
+        self._stored = {stored.id: stored for stored in await db.channel_webhooks.get_all()}
+        self._webhook_ids = {stored.webhook_id for stored in self._stored.values()}
+        for stored in self._stored.values():
+            self.rate_limits.link_webhook(stored.webhook_id, stored.id)
+        logger.info(f'Loaded {len(self._stored)} channel webhooks')
+
+    def is_own(self, webhook_id: int) -> bool:
+        return webhook_id in self._webhook_ids
+
+    def get_cached(self, channel_id: int) -> discord.Webhook | None:
+        webhook = self._webhooks.get(channel_id)
+        if webhook is None and channel_id in self._stored:
+            stored = self._stored[channel_id]
+            webhook = discord.Webhook.partial(stored.webhook_id, stored.token, client=self.client)
+            self._webhooks[channel_id] = webhook
+        return webhook
+
+    async def get(self, channel: discord.TextChannel) -> discord.Webhook | None:
+        webhook = self.get_cached(channel.id)
+        if webhook is not None or self._unavailable.get(channel.id):
+            return webhook
+
+        async with self._locks.setdefault(channel.id, asyncio.Lock()):
+            webhook = self.get_cached(channel.id)
+            if webhook is not None or self._unavailable.get(channel.id):
+                return webhook
+
+            try:
+                webhook = next(
+                    (w for w in await channel.webhooks() if w.user == self.client.user and w.token is not None),
+                    None
+                )
+                if webhook is None:
+                    webhook = await channel.create_webhook(name=settings.display_name)
+                    logger.info(f'Created webhook {webhook.id} for channel {channel.id}')
+            except discord.HTTPException as e:
+                logger.warning(f'No webhook for channel {channel.id}, sending embeds: {e}')
+                self._unavailable.put(channel.id, True)
+                return None
+
+            stored = db.ChannelWebhook(id=channel.id, webhook_id=webhook.id, token=webhook.token)
+            if channel.id in self._stored:
+                await db.channel_webhooks.update(stored)
+            else:
+                await db.channel_webhooks.create(stored)
+            self._stored[channel.id] = stored
+            self._webhook_ids.add(webhook.id)
+            self.rate_limits.link_webhook(webhook.id, channel.id)
+            self._webhooks[channel.id] = webhook
+            return webhook
+
+    async def evict(self, channel_id: int) -> None:
+        self._webhooks.pop(channel_id, None)
+        stored = self._stored.pop(channel_id, None)
+        if stored is not None:
+            self._webhook_ids.discard(stored.webhook_id)
+            await db.channel_webhooks.remove_by(id=channel_id)
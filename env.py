@@ -1,6 +1,24 @@
+import enum
+
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class DeliveryMode(str, enum.Enum):
+    EMBED = 'embed'
+    WEBHOOK = 'webhook'
+
+
+class RuntimeProfile(str, enum.Enum):
+    DEFAULT = 'default'
+    LEAN = 'lean'
+
+
+class LogFormat(str, enum.Enum):
+    TEXT = 'text'
+    JSON = 'json'
+
+
 class Settings(BaseSettings):
     service_name: str = 'bridge-bot'
     display_name: str = 'Connecty'
@@ -9,12 +27,110 @@ class Settings(BaseSettings):
 
     mongodb_host: str
     mongodb_port: int
+    # size of the thread pool running blocking pymongo calls
+    mongodb_max_workers: int = 16
+    # write-behind buffers for message mapping inserts
+    write_buffer_max_size: int = 200
+    write_buffer_flush_seconds: float = 1.0
+    # explain() the bot's query shapes on startup and warn about collection scans
+    db_check_query_plans: bool = False
+    # message mapping retention, unset keeps rows forever
+    bridge_messages_retention_days: float | None = None
+    forwarded_messages_retention_days: float | None = None
+    # move expired rows to compressed <collection>_archive before the TTL index removes them
+    archive_expired_messages: bool = False
+    archive_interval_minutes: float = 60.0
+    archive_batch_size: int = 1000
+    archive_grace_hours: float = 24.0
 
     manager_usernames: list[str] = ['nikitacometa']
 
     log_level: str = 'INFO'
+    # json writes one object per line, for docker's json-file driver and log shippers
+    log_format: LogFormat = LogFormat.TEXT
+    # records waiting for the writer thread, the oldest are dropped when stdout can't keep up
+    log_queue_size: int = 10_000
+    # keeps one in this many debug records of every call site, 1 keeps all of them
+    log_debug_sample_every: int = 1
+    # Prometheus /metrics endpoint, an empty METRICS_PORT disables it
+    metrics_port: int | None = 9100
+    event_loop_lag_interval_seconds: float = 0.5
+
+    # max parallel sends when forwarding one message to the bridge channels
+    fanout_max_concurrency: int = 8
+    # max parallel Discord sends across all per-channel send queues
+    send_max_concurrency: int = 25
+    # idle per-channel send workers stop after this many seconds
+    send_queue_idle_seconds: float = 60.0
+    # keep the in-memory routing index fresh via Mongo change streams (needs replica set)
+    routing_change_streams: bool = False
+    # webhook mode posts copies with the author's name and avatar, through one webhook per channel
+    delivery_mode: DeliveryMode = DeliveryMode.EMBED
+    # channels where the bot can't get a webhook get embeds, and the webhook is tried again after this many seconds
+    webhook_retry_seconds: float = 600.0
+    # attachments are streamed once into a bounded spool on the mounted /tmp volume and uploaded from there
+    attachment_spool_dir: str = '/tmp/attachments'
+    attachment_spool_max_mb: float = 1024.0
+    # larger attachments, or larger than the target server allows, are forwarded as links
+    attachment_max_mb: float = 25.0
+    # edits of an original within this window are applied to its copies once
+    edit_coalesce_seconds: float = 1.0
+
+    # lean keeps only what forwarding reads: minimal intents, no member cache, no chunking at startup
+    runtime_profile: RuntimeProfile = RuntimeProfile.DEFAULT
+    # discord.py message caches of the profiles, edits and deletes are handled from raw events
+    max_messages: int | None = 1000
+    lean_max_messages: int | None = None
+    # channels and members fetched over REST when discord.py's cache doesn't have them
+    fetch_cache_size: int = 1000
+    fetch_cache_ttl_seconds: float = 300.0
+
+    # AutoShardedBot instead of a single gateway connection, unset shard_count lets Discord pick it
+    sharded: bool = False
+    shard_count: int | None = None
+    # shards run by this process when they are split across processes, copies for channels of other
+    # processes are sent by them from the outbox
+    shard_ids: list[int] | None = None
+    # durable outbox of copies: claimed with leases, retried with backoff, replayed on ready
+    delivery_poll_seconds: float = 1.0
+    delivery_batch_size: int = 100
+    delivery_lease_seconds: float = 60.0
+    delivery_max_attempts: int = 5
+    delivery_ack_flush_seconds: float = 0.5
+    outbox_retention_hours: float = 24.0
+    # on ready, forward up to this many messages per bridged channel that arrived while the bot was away
+    catch_up_limit: int = 100
+    # a channel that joins a bridge gets up to this many earlier messages of the other channels, 0 turns it off,
+    # backfill_hours only takes messages of the last hours
+    backfill_limit: int = 0
+    backfill_hours: float | None = None
+    # messages per outbox write and progress update, at most what is sent in half a delivery lease,
+    # and the pause between their sends
+    backfill_batch_size: int = 50
+    backfill_send_interval_seconds: float = 1.0
+    # /search_bridge: matches shown per search, the time range when none is given, and the server-side
+    # time limit of a search query
+    search_max_results: int = 50
+    search_default_days: float = 30.0
+    search_max_time_ms: int = 2000
+    # reload interval of the routing index in multi-process mode without change streams
+    routing_refresh_seconds: float = 30.0
+
+    # users cache in front of get_user_or_create
+    user_cache_size: int = 10_000
+    user_cache_ttl_seconds: float = 600.0
+    # recent forwarded copies for reply lookups, plus a Bloom filter of all copy ids
+    reply_cache_size: int = 50_000
+    reply_cache_ttl_minutes: float = 60.0
+    reply_filter_capacity: int = 5_000_000
+    reply_filter_error_rate: float = 0.01
 
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
 
+    @field_validator('metrics_port', mode='before')
+    @classmethod
+    def empty_port_disables(cls, value):
+        return None if value == '' else value
+
 
 settings = Settings()
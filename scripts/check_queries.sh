@@ -0,0 +1,3 @@
+#!/bin/sh
+
+docker-compose exec bot pipenv run python -m bot.db.diagnostics